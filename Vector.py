@@ -1,4 +1,13 @@
-import discord, json, os, asyncio
+import discord, aiohttp, json, os, re, asyncio, bisect, contextlib, functools, gzip, hashlib, heapq, random, sqlite3, threading, time, traceback
+from aiohttp import web
+from types import MappingProxyType
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from collections import Counter, defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from discord.ext import commands
 from discord import app_commands
 
@@ -8,109 +17,1149 @@ intents.guilds = True
 intents.message_content = True
 
 # Load config
-with open("config.json") as f:
-    config = json.load(f)
+CONFIG_FILE = "config.json"
+
+def read_config(path):
+    with open(path) as f:
+        return json.load(f)
+
+config = read_config(CONFIG_FILE)
+
+# Auto-assigning tickets and bulk rank changes by role need the member list of those
+# roles (the Server Members intent has to be enabled in the developer portal too)
+if config.get("claims", {}).get("auto_assign") or config.get("bulk_rank", {}).get("by_role"):
+    intents.members = True
+
+# Lean gateway mode: only subscribe to and cache what the features actually use
+gateway_cfg = config.get("gateway", {})
+if gateway_cfg.get("lean"):
+    # Guild state, guild messages (activity tracking) and message content (transcripts).
+    # No typing, DM, voice, reaction, invite... events.
+    intents = discord.Intents(guilds=True, guild_messages=True, message_content=True, members=intents.members)
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.joined = intents.members  # role.members for auto-assign and bulk rank
+    gateway_options = {
+        "max_messages": gateway_cfg.get("max_messages") or None,  # None disables discord.py's message cache
+        "member_cache_flags": member_cache_flags,
+        "chunk_guilds_at_startup": intents.members,
+    }
+else:
+    gateway_options = {}
+
+# Sharded mode: one process serves every configured guild over as many gateway shards
+# as Discord recommends (or gateway.shard_count)
+if gateway_cfg.get("sharded"):
+    gateway_options["shard_count"] = gateway_cfg.get("shard_count") or None
 
-GUILD_ID = config["public_guild_id"]
-GUILD = discord.Object(id=GUILD_ID)
+GUILD_ID = config["public_guild_id"]  # Primary guild: rank sync target, owner of pre-partition data
+# Every guild the slash commands are registered to at startup (public_guild_id plus config["guilds"])
+GUILDS = [discord.Object(id=GUILD_ID)] + [discord.Object(id=int(gid)) for gid in config.get("guilds", {})]
 TOKEN = config["token"]
-status_text = config.get("status", "Watching Vilyx Network")
-data_file = "data.json"
+
+# Config snapshots
+# Everything handlers read from config.json lives in one immutable Settings snapshot,
+# derived structures included (rank hierarchy, overwrite templates, permission sets).
+# A reload builds a complete new snapshot and swaps the global reference in one step, so
+# the bot sees either the old config or the new one, never a mix. The tuning sections
+# (storage, jobs, log_dispatch, ...) are only read at startup.
+#
+# The top-level channels/ticket_categories/public_roles/permissions/tickets sections
+# describe public_guild_id. Every entry under "guilds" (keyed by guild id) describes
+# another guild with the same sections, where permissions and tickets fall back to the
+# top-level values key by key. Handlers read their guild's GuildSettings.
 
 # Define the hierarchy in order from lowest to highest
-ROLE_HIERARCHY = [
-    config["public_roles"]["member"],        # Member
-    config["public_roles"]["mod"],        # Mod
-    config["public_roles"]["sr_mod"],     # Sr Mod
-    config["public_roles"]["admin"],      # Admin
-    config["public_roles"]["sr_admin"],   # Sr Admin
-    config["public_roles"]["manager"],    # Manager
-    config["public_roles"]["owner"],      # Owner
-]
-
-# Load persistent ticket data
-if not os.path.exists(data_file):
-    with open(data_file, "w") as f: json.dump({}, f)
-with open(data_file) as f:
-    ticket_data = json.load(f)
-
-def save_data():
-    with open(data_file, "w") as f:
-        json.dump(ticket_data, f, indent=2)
-
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-async def log(msg):
-    ch = bot.get_channel(config["channels"]["logs"])
-    if ch: await ch.send(msg)
+RANK_KEYS = ["member", "mod", "sr_mod", "admin", "sr_admin", "manager", "owner"]
+
+GENERAL_TICKETS = ["General Support", "Bug Report", "Player Report", "Media Applications"]
+SENSITIVE_TICKETS = ["Report a Staff Member", "Store Issues", "Appeals", "Staff Applications"]
+
+TicketTemplate = namedtuple("TicketTemplate", ["parent_id", "sensitive", "role_ids"])
+
+HIDDEN = discord.PermissionOverwrite(view_channel=False)
+VIEW_AND_SEND = discord.PermissionOverwrite(view_channel=True, send_messages=True)
+
+def build_ticket_templates(cfg):
+    roles = cfg["public_roles"]
+    # General tickets: generic 'staff' role access
+    general = TicketTemplate(cfg["ticket_categories"]["general_tickets"], False, frozenset([roles["staff"]]))
+    # Staff/Store tickets: only Admin+ can see these (Crucial for restriction)
+    sensitive = TicketTemplate(cfg["ticket_categories"]["staff_store_tickets"], True,
+                               frozenset(rid for k in ["admin", "sr_admin", "manager", "owner"] if (rid := roles.get(k))))
+    templates = {category: general for category in GENERAL_TICKETS}
+    templates.update({category: sensitive for category in SENSITIVE_TICKETS})
+    return MappingProxyType(templates)
+
+# Who may do what, as lists of public_roles keys (or raw role ids). config["permissions"]
+# overrides these per permission.
+DEFAULT_PERMISSIONS = {
+    "close_ticket": ["mod", "sr_mod", "admin", "sr_admin", "manager", "owner"],
+    "view_tickets": ["mod", "sr_mod", "admin", "sr_admin", "manager", "owner"],
+    "delete_ticket": ["sr_admin", "manager", "owner"],
+    "send_ip": ["mod", "sr_mod", "admin", "sr_admin", "manager", "developer", "owner"],
+    "send_embed": ["manager", "owner"],
+    "manage_ranks": ["manager", "owner"],
+}
+
+def compile_permissions(cfg):
+    policy = {**DEFAULT_PERMISSIONS, **cfg.get("permissions", {})}
+    roles = cfg["public_roles"]
+    return MappingProxyType({
+        perm: frozenset(rid for rid in (roles.get(k) if isinstance(k, str) else k for k in keys) if rid)
+        for perm, keys in policy.items()
+    })
+
+def guild_sections(cfg):
+    # guild id -> (config path prefix, that guild's sections), public_guild_id first
+    sections = {cfg["public_guild_id"]: ("", cfg)}
+    for gid, g in cfg.get("guilds", {}).items():
+        if not isinstance(g, dict):
+            raise ValueError(f"'guilds.{gid}' must be an object")
+        sections[int(gid)] = (f"guilds.{gid}.", {
+            **g,
+            "permissions": {**cfg.get("permissions", {}), **g.get("permissions", {})},
+            "tickets": {**cfg.get("tickets", {}), **g.get("tickets", {})},
+        })
+    return sections
+
+def validate_guild(prefix, cfg, own_permissions):
+    # own_permissions: the permission lists this guild's section sets itself. Role names in
+    # lists inherited from the top level may not exist in every guild, compile_permissions
+    # simply leaves those out, so only the guild's own lists must name its roles.
+    def ids(section, keys):
+        values = cfg.get(section)
+        if not isinstance(values, dict):
+            raise ValueError(f"'{prefix}{section}' must be an object")
+        for key in keys:
+            if not isinstance(values.get(key), int):
+                raise ValueError(f"'{prefix}{section}.{key}' must be an id")
+
+    ids("channels", ["ticket_panel", "logs"])
+    ids("ticket_categories", ["general_tickets", "staff_store_tickets"])
+    ids("public_roles", RANK_KEYS + ["staff"])
+
+    for perm, keys in cfg.get("permissions", {}).items():
+        if not isinstance(keys, list):
+            raise ValueError(f"'{prefix}permissions.{perm}' must be a list")
+        for key in keys:
+            if isinstance(key, str) and perm in own_permissions and key not in cfg["public_roles"]:
+                raise ValueError(f"'{prefix}permissions.{perm}' names unknown role '{key}'")
+            if not isinstance(key, (str, int)):
+                raise ValueError(f"'{prefix}permissions.{perm}' entries must be role names or ids")
+
+    for key in ["close_delay", "create_interval"]:
+        value = cfg.get("tickets", {}).get(key, 0)
+        if not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(f"'{prefix}tickets.{key}' must be a non-negative number")
+
+def validate_config(cfg):
+    # Raises ValueError naming the first problem found
+    if not isinstance(cfg.get("token"), str):
+        raise ValueError("'token' must be a string")
+    if not isinstance(cfg.get("public_guild_id"), int):
+        raise ValueError("'public_guild_id' must be an id")
+    if not isinstance(cfg.get("guilds", {}), dict) or not all(gid.isdigit() for gid in cfg.get("guilds", {})):
+        raise ValueError("'guilds' must be an object keyed by guild id")
+    for gid, (prefix, g) in guild_sections(cfg).items():
+        own = cfg if gid == cfg["public_guild_id"] else cfg["guilds"][str(gid)]
+        validate_guild(prefix, g, own.get("permissions", {}))
+    for key in ["concurrency", "progress_every"]:
+        value = cfg.get("bulk_rank", {}).get(key, 1)
+        if not isinstance(value, int) or value < 1:
+            raise ValueError(f"'bulk_rank.{key}' must be a positive integer")
+
+def freeze(obj):
+    if isinstance(obj, dict):
+        return MappingProxyType({k: freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(freeze(v) for v in obj)
+    return obj
+
+GuildSettings = namedtuple("GuildSettings", [
+    "guild_id", "roles", "channels", "categories", "tickets",
+    "role_hierarchy", "ticket_templates", "fallback_template", "permissions",
+])
+
+Settings = namedtuple("Settings", ["raw", "guild_id", "status", "guilds"])
+
+def build_guild_settings(guild_id, raw):
+    roles = raw["public_roles"]
+    return GuildSettings(
+        guild_id=guild_id,
+        roles=roles,
+        channels=raw["channels"],
+        categories=raw["ticket_categories"],
+        tickets=raw.get("tickets", MappingProxyType({})),
+        role_hierarchy=tuple(roles[k] for k in RANK_KEYS),
+        ticket_templates=build_ticket_templates(raw),
+        fallback_template=TicketTemplate(None, False, frozenset([roles["staff"]])),  # guild root
+        permissions=compile_permissions(raw),
+    )
+
+def build_settings(cfg):
+    validate_config(cfg)
+    raw = freeze(cfg)
+    return Settings(
+        raw=raw,
+        guild_id=raw["public_guild_id"],
+        status=raw.get("status", "Watching Vilyx Network"),
+        guilds=MappingProxyType({gid: build_guild_settings(gid, freeze(g)) for gid, (_, g) in guild_sections(cfg).items()}),
+    )
+
+settings = build_settings(config)
+
+# Metrics
+# Handler latency histograms, Discord HTTP and rate limit counters and persistence timings
+# are kept in process and served in the Prometheus text format on a local port (and
+# summarised by /stats). With metrics.enabled off every hook is a flag check and nothing
+# is recorded.
+metrics_cfg = config.get("metrics", {})
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Interpolates inside the bucket holding the q-th observation, like histogram_quantile().
+        # Anything past the last bucket reports that bucket's bound.
+        if not self.count:
+            return 0.0
+        rank, seen, lower = q * self.count, 0, 0.0
+        for bound, n in zip(self.buckets, self.counts):
+            if n and seen + n >= rank:
+                return lower + (bound - lower) * (rank - seen) / n
+            seen += n
+            lower = bound
+        return self.buckets[-1]
+
+def label_value(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{label_value(v)}"' for k, v in labels) + "}"
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = Counter()  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self._lock = threading.Lock()  # The store writer threads record too
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] += value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = Histogram()
+            h.observe(seconds)
+
+    def timer(self, name, **labels):
+        return self._timed(name, labels) if self.enabled else NO_TIMER
+
+    @contextlib.contextmanager
+    def _timed(self, name, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def total(self, name):
+        with self._lock:
+            return sum(v for (n, _), v in self.counters.items() if n == name)
+
+    def summary(self, name):
+        # [(labels, count, p50, p99)] for every label set of one histogram
+        with self._lock:
+            return [(dict(labels), h.count, h.quantile(0.5), h.quantile(0.99))
+                    for (n, labels), h in self.histograms.items() if n == name]
+
+    def render(self, gauges=()):
+        # gauges: (name, labels dict, value) sampled by the caller at scrape time
+        out, typed = [], set()
+
+        def family(name, kind):
+            if name not in typed:
+                typed.add(name)
+                out.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                family(name, "counter")
+                out.append(f"{name}{format_labels(labels)} {value}")
+            for (name, labels), h in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                family(name, "histogram")
+                cumulative = 0
+                for bound, n in zip(h.buckets + ("+Inf",), h.counts):
+                    cumulative += n
+                    out.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                out.append(f"{name}_sum{format_labels(labels)} {h.sum}")
+                out.append(f"{name}_count{format_labels(labels)} {h.count}")
+        for name, labels, value in sorted(gauges, key=lambda g: g[0]):
+            family(name, "gauge")
+            out.append(f"{name}{format_labels(tuple(labels.items()))} {value}")
+        return "\n".join(out) + "\n"
+
+NO_TIMER = contextlib.nullcontext()
+metrics = Metrics(metrics_cfg.get("enabled", False))
+
+def instrumented(name):
+    # Innermost decorator on command and button callbacks. Times the handler until it
+    # returns, work it hands to the job queue is not included.
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                metrics.observe("vector_handler_seconds", time.perf_counter() - start, handler=name)
+                metrics.inc("vector_handler_calls_total", handler=name, outcome=outcome)
+        return wrapper
+    return decorator
+
+# Snowflakes and interaction/webhook tokens are collapsed so routes stay low-cardinality
+ROUTE_IDS = re.compile(r"/(?:\d{15,20}|[\w-]{60,})(?=/|$)")
+
+def http_route(path):
+    return ROUTE_IDS.sub("/{id}", re.sub(r"^/api/v\d+", "", path))
+
+async def on_http_request_start(session, ctx, params):
+    ctx.start = time.perf_counter()
+
+async def on_http_request_end(session, ctx, params):
+    route, status = http_route(params.url.path), params.response.status
+    metrics.inc("vector_http_requests_total", method=params.method, route=route, status=status)
+    metrics.observe("vector_http_seconds", time.perf_counter() - ctx.start, method=params.method, route=route)
+    if status == 429:
+        # discord.py sleeps for this long before retrying
+        metrics.inc("vector_http_rate_limited_total", route=route, scope=params.response.headers.get("X-RateLimit-Scope", "user"))
+        try:
+            metrics.inc("vector_rate_limit_wait_seconds_total", float(params.response.headers.get("Retry-After", 0)), route=route)
+        except ValueError:
+            pass
+
+def http_trace():
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_http_request_start)
+    trace.on_request_end.append(on_http_request_end)
+    return trace
+
+# Persistent ticket store
+# data.json holds a compacted snapshot, data.journal an append-only log of ticket
+# events on top of it. Mutations only append one line (on a writer thread), so the
+# cost per click stays flat no matter how many tickets exist. The writer keeps its own
+# replica of the tickets, built from the journaled events, and writes the snapshot from
+# it once the journal has grown as large as the snapshot, so compaction never copies
+# the tickets on the event loop and costs O(1) per mutation amortised. Set storage.backend
+# to "sqlite" to keep tickets in an indexed database instead (see SQLiteTicketStore).
+# Every guild has its own store, see Guild partitions below.
+storage_cfg = config.get("storage", {})
+data_file = storage_cfg.get("data_file", "data.json")
+journal_file = storage_cfg.get("journal_file", "data.journal")
+
+def load_json_tickets(snapshot_path, journal_path):
+    tickets = {}
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path) as f:
+            tickets = json.load(f)
+    if os.path.exists(journal_path):
+        with open(journal_path) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break  # Partial write from a crash, nothing valid follows it
+                apply_event(tickets, event)
+    return tickets
+
+def apply_event(tickets, event):
+    if event["op"] == "put":
+        tickets[event["id"]] = event["ticket"]
+    elif event["op"] == "delete":
+        tickets.pop(event["id"], None)
+
+def archived_since(t):
+    # Records from before archived_at was kept fall back to their creation time
+    return t.get("archived_at") or t.get("created_at")
+
+def patch_ticket(t, fields):
+    # Field-level update, None removes the field
+    for key, value in fields.items():
+        if value is None:
+            t.pop(key, None)
+        else:
+            t[key] = value
+
+class TicketStore:
+    def __init__(self, snapshot_path, journal_path, compact_every=500):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self.pending = 0  # journal entries written since the last snapshot
+        self._journal = None  # only touched from the writer thread
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ticket-store")
+
+        self.tickets = load_json_tickets(snapshot_path, journal_path)
+        # The writer's copy, only touched from the writer thread (tickets are flat dicts)
+        self._replica = {cid: dict(t) for cid, t in self.tickets.items()}
+        # Fold any leftover journal into a fresh snapshot before appending again,
+        # so a torn line from a crash never ends up in the middle of the journal
+        self._write_snapshot()
+
+    # Queries are plain scans here, the SQLite backend answers them from indexes
+
+    async def get(self, cid):
+        return self.tickets.get(cid)
+
+    async def open_tickets(self):
+        return {cid: t for cid, t in self.tickets.items() if not t.get("archived")}
+
+    async def pending_closes(self):
+        return {cid: t for cid, t in self.tickets.items() if t.get("close_at")}
+
+    async def expired_archives(self, keep, before):
+        # Oldest first: everything over the count limit (0 is no limit), plus anything archived before the cutoff
+        ordered = sorted(((cid, t) for cid, t in self.tickets.items() if t.get("archived")),
+                         key=lambda item: archived_since(item[1]) or 0)
+        excess = len(ordered) - keep if keep else 0
+        expired = {}
+        for idx, (cid, t) in enumerate(ordered):
+            since = archived_since(t)
+            if idx < excess or (before and since and since < before):
+                expired[cid] = t
+        return expired
+
+    async def counts(self):
+        archived = sum(1 for t in self.tickets.values() if t.get("archived"))
+        return {"open": len(self.tickets) - archived, "archived": archived}
+
+    def put(self, cid, ticket):
+        self.tickets[cid] = ticket
+        self._append({"op": "put", "id": cid, "ticket": ticket})
+
+    def update(self, cid, **fields):
+        t = self.tickets.get(cid)
+        if t is not None:
+            patch_ticket(t, fields)
+            self._append({"op": "put", "id": cid, "ticket": t})
+
+    def delete(self, cid):
+        if self.tickets.pop(cid, None) is not None:
+            self._append({"op": "delete", "id": cid})
+
+    def _append(self, event):
+        # Serialise here so the writer never sees a ticket that is mid-mutation
+        self._writer.submit(self._write_line, json.dumps(event) + "\n")
+        self.pending += 1
+        if self.pending >= max(self.compact_every, len(self.tickets)):
+            self.compact()
+
+    def compact(self):
+        self.pending = 0
+        self._writer.submit(self._write_snapshot)
+
+    def close(self):
+        # Flush everything on shutdown and leave a clean snapshot behind
+        self.compact()
+        self._writer.submit(self._close_journal)
+        self._writer.shutdown(wait=True)
+
+    # Writer thread
+
+    def _write_line(self, line):
+        apply_event(self._replica, json.loads(line))
+        try:
+            with metrics.timer("vector_store_seconds", backend="json", op="append"):
+                if self._journal is None:
+                    self._journal = open(self.journal_path, "a")
+                self._journal.write(line)
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+        except OSError as e:
+            print(f"⚠️ Failed to append to {self.journal_path}: {e}")
+
+    def _write_snapshot(self):
+        try:
+            tmp = self.snapshot_path + ".tmp"
+            with metrics.timer("vector_store_seconds", backend="json", op="snapshot"):
+                with open(tmp, "w") as f:
+                    json.dump(self._replica, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.snapshot_path)  # Atomic, readers see old or new, never half
+
+            # Everything journaled so far is in the snapshot now
+            self._close_journal()
+            open(self.journal_path, "w").close()
+        except OSError as e:
+            print(f"⚠️ Failed to write snapshot {self.snapshot_path}: {e}")
+
+    def _close_journal(self):
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+class SQLiteTicketStore:
+    # Optional backend for large histories: only what a query asks for is loaded,
+    # and every statement runs on one worker thread that owns the connection.
+    UPSERT = "INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+    def __init__(self, db_path, migrate_from=None):
+        self.db_path = db_path
+        self._db = None
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ticket-db",
+                                          initializer=self._connect)
+        self._worker.submit(self._create_schema).result()
+        if migrate_from:
+            self._worker.submit(self._migrate, *migrate_from).result()
+
+    def _connect(self):
+        self._db = sqlite3.connect(self.db_path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+
+    def _create_schema(self):
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS tickets (
+                channel_id INTEGER PRIMARY KEY,
+                user_id    INTEGER NOT NULL,
+                category   TEXT    NOT NULL,
+                archived   INTEGER NOT NULL DEFAULT 0,
+                claimed    INTEGER NOT NULL DEFAULT 0,
+                created_at REAL,
+                data       TEXT    NOT NULL,
+                archived_at REAL,
+                close_at   REAL
+            );
+            DROP INDEX IF EXISTS tickets_user;
+            DROP INDEX IF EXISTS tickets_category;
+            DROP INDEX IF EXISTS tickets_state;
+            DROP INDEX IF EXISTS tickets_created;
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(tickets)")}
+        if "close_at" not in columns:
+            # Databases from before the retention and close columns, filled in from the stored records
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute("ALTER TABLE tickets ADD COLUMN archived_at REAL")
+                self._db.execute("ALTER TABLE tickets ADD COLUMN close_at REAL")
+                rows = self._db.execute("SELECT channel_id, data FROM tickets").fetchall()
+                self._db.executemany(self.UPSERT, [self._row(cid, json.loads(data)) for cid, data in rows])
+        # One index per query below: listing by state, the retention sweep and the close scheduler
+        self._db.executescript("""
+            CREATE INDEX IF NOT EXISTS tickets_archived    ON tickets (archived, created_at);
+            CREATE INDEX IF NOT EXISTS tickets_archive_age ON tickets (archived, archived_at);
+            CREATE INDEX IF NOT EXISTS tickets_closing     ON tickets (close_at) WHERE close_at IS NOT NULL;
+        """)
+
+    def _migrate(self, snapshot_path, journal_path):
+        # One-shot import of the data.json format, the old files are renamed so it never runs twice
+        if not os.path.exists(snapshot_path):
+            return
+        tickets = load_json_tickets(snapshot_path, journal_path)
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(self.UPSERT, [self._row(cid, t) for cid, t in tickets.items()])
+        for path in (snapshot_path, journal_path):
+            if os.path.exists(path):
+                os.replace(path, path + ".migrated")
+        print(f"✅ Migrated {len(tickets)} tickets from {snapshot_path} to {self.db_path}")
+
+    @staticmethod
+    def _row(cid, t):
+        archived = bool(t.get("archived"))
+        return (int(cid), t["user"], t["category"], int(archived), int(t.get("claimed") or 0),
+                t.get("created_at"), json.dumps(t), archived_since(t) if archived else None, t.get("close_at"))
+
+    def _query(self, sql, *params):
+        with metrics.timer("vector_store_seconds", backend="sqlite", op="query"):
+            return {str(cid): json.loads(data) for cid, data in self._db.execute(sql, params)}
+
+    async def _run(self, sql, *params):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._worker, self._query, sql, *params)
+
+    async def get(self, cid):
+        rows = await self._run("SELECT channel_id, data FROM tickets WHERE channel_id = ?", int(cid))
+        return rows.get(str(cid))
+
+    async def open_tickets(self):
+        return await self._run("SELECT channel_id, data FROM tickets WHERE archived = 0 ORDER BY created_at")
+
+    async def pending_closes(self):
+        return await self._run("SELECT channel_id, data FROM tickets WHERE close_at IS NOT NULL")
+
+    async def expired_archives(self, keep, before):
+        # A NULL cutoff matches nothing, LIMIT -1 keeps every row
+        return await self._run("""
+            SELECT channel_id, data FROM tickets
+            WHERE archived = 1 AND (archived_at < ? OR channel_id NOT IN (
+                SELECT channel_id FROM tickets WHERE archived = 1 ORDER BY archived_at DESC LIMIT ?))
+            ORDER BY archived_at""", before, keep or -1)
+
+    def _counts(self):
+        counts = dict(self._db.execute("SELECT archived, COUNT(*) FROM tickets GROUP BY archived"))
+        return {"open": counts.get(0, 0), "archived": counts.get(1, 0)}
+
+    async def counts(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._worker, self._counts)
+
+    # Writes are queued on the worker in call order, callers never wait on disk.
+    # get() hands out copies here, so handlers that await between reading and writing a
+    # ticket change it with update(), which patches the current row on the worker,
+    # instead of put()ting back a possibly stale copy.
+
+    def put(self, cid, ticket):
+        self._worker.submit(self._execute, self.UPSERT, self._row(cid, ticket))
+
+    def update(self, cid, **fields):
+        self._worker.submit(self._patch, cid, fields)
+
+    def _patch(self, cid, fields):
+        try:
+            with metrics.timer("vector_store_seconds", backend="sqlite", op="write"):
+                row = self._db.execute("SELECT data FROM tickets WHERE channel_id = ?", (int(cid),)).fetchone()
+                if row is None:
+                    return  # Deleted in the meantime
+                t = json.loads(row[0])
+                patch_ticket(t, fields)
+                self._db.execute(self.UPSERT, self._row(cid, t))
+        except sqlite3.Error as e:
+            print(f"⚠️ Ticket database write failed: {e}")
+
+    def delete(self, cid):
+        self._worker.submit(self._execute, "DELETE FROM tickets WHERE channel_id = ?", (int(cid),))
+
+    def _execute(self, sql, params):
+        try:
+            with metrics.timer("vector_store_seconds", backend="sqlite", op="write"):
+                self._db.execute(sql, params)
+        except sqlite3.Error as e:
+            print(f"⚠️ Ticket database write failed: {e}")
+
+    def close(self):
+        self._worker.submit(self._db_close)
+        self._worker.shutdown(wait=True)
+
+    def _db_close(self):
+        self._db.close()
+
+# Guild partitions
+# Each configured guild gets its own ticket store, search index and transcript directory
+# (file names carry the guild id, e.g. data.<guild id>.json), plus its own open ticket
+# index, claim queue and channel-creation queue. Guilds never share a file, a writer
+# thread or a rate-limit queue. Partitions are opened at startup and when a config
+# reload adds a guild.
+def partition_path(path, guild_id):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{guild_id}{ext}"
+
+def adopt_legacy_files(guild_id):
+    # Everything stored before tickets were partitioned belongs to public_guild_id
+    for path in (data_file, journal_file, storage_cfg.get("sqlite_file", "tickets.db"), search_cfg.get("db_file", "search.db")):
+        for suffix in ("", "-wal", "-shm"):
+            target = partition_path(path, guild_id) + suffix
+            if os.path.exists(path + suffix) and not os.path.exists(target):
+                os.replace(path + suffix, target)
+    if os.path.isdir(TRANSCRIPT_DIR):
+        guild_dir = os.path.join(TRANSCRIPT_DIR, str(guild_id))
+        for entry in os.scandir(TRANSCRIPT_DIR):
+            if entry.name.endswith(".jsonl.gz") and entry.is_file():
+                os.makedirs(guild_dir, exist_ok=True)
+                os.replace(entry.path, os.path.join(guild_dir, entry.name))
+
+class Partition:
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        data, journal = partition_path(data_file, guild_id), partition_path(journal_file, guild_id)
+        if storage_cfg.get("backend", "json") == "sqlite":
+            self.store = SQLiteTicketStore(partition_path(storage_cfg.get("sqlite_file", "tickets.db"), guild_id),
+                                           migrate_from=(data, journal))
+        else:
+            self.store = TicketStore(data, journal, storage_cfg.get("compact_every", 500))
+        self.transcript_dir = os.path.join(TRANSCRIPT_DIR, str(guild_id))
+        self.search = TicketSearchIndex(partition_path(search_cfg.get("db_file", "search.db"), guild_id), self.transcript_dir)
+        self.open_index = {}  # (user id, category) -> channel id, None while the channel is being created
+        self.claims = ClaimIndex(self.store)
+        self.admission = TicketAdmission(guild_id)
+
+    def close(self):
+        self.store.close()
+        self.search.close()
+
+partitions = {}  # guild id -> Partition
+
+async def open_partition(guild_id):
+    if guild_id in partitions:
+        return partitions[guild_id]
+    if guild_id == GUILD_ID:
+        await asyncio.to_thread(adopt_legacy_files, guild_id)
+    p = await asyncio.to_thread(Partition, guild_id)  # Loads the store from disk
+    await load_open_ticket_index(p)
+    await p.claims.load()
+    await close_scheduler.load(p)
+    await activity_tracker.load(p)
+    partitions[guild_id] = p
+    return p
+
+async def get_ticket(channel):
+    # (partition, ticket record) for a ticket channel, the record is None for any other channel
+    p = partitions.get(channel.guild.id)
+    return p, (await p.store.get(str(channel.id)) if p else None)
+
+# Small bits of bot state that have to survive restarts (panel message, command tree hash)
+state_file = storage_cfg.get("state_file", "state.json")
+
+def load_state():
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file) as f:
+        return json.load(f)
+
+def write_state(state):
+    tmp = state_file + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, state_file)
+
+async def save_state():
+    await asyncio.to_thread(write_state, dict(bot_state))
+
+bot_state = load_state()
+
+# The panel message and archive overflow used to be kept for the one guild at the top level
+legacy_state = {key: bot_state.pop(key) for key in ("panel_message_id", "archive_overflow") if key in bot_state}
+if legacy_state:
+    bot_state.setdefault("guilds", {}).setdefault(str(GUILD_ID), {}).update(legacy_state)
+
+def guild_state(guild_id):
+    return bot_state.setdefault("guilds", {}).setdefault(str(guild_id), {})
+
+# Log pipeline
+# log() only queues the line. A background task coalesces queued lines into as few
+# messages as possible every few seconds (or sooner once enough lines pile up), so
+# logging never sits on a handler's critical path or eats the channel's rate limit.
+# Every guild's lines go to its own log channel through its own bounded queue, so a
+# guild whose log channel is gone can't crowd out the others.
+log_cfg = config.get("log_dispatch", {})
+MAX_MESSAGE_LEN = 2000
+
+class LogDispatcher:
+    def __init__(self, flush_interval=5, flush_lines=20, max_queue=500):
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.max_queue = max_queue  # per guild
+        self.queues = {}  # guild id -> lines waiting for that guild's log channel
+        self.pending = 0  # lines across all queues
+        self.dropped = Counter()  # guild id -> lines refused while its queue was full, reported on the next flush
+        self._wake = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    def push(self, guild_id, msg):
+        queue = self.queues.setdefault(guild_id, deque())
+        if len(queue) >= self.max_queue:
+            self.dropped[guild_id] += 1
+            return
+        queue.append(str(msg)[:MAX_MESSAGE_LEN])
+        self.pending += 1
+        if len(queue) >= self.flush_lines:
+            self._wake.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Let the loop finish its current batch and do one last flush
+        self._closing = True
+        self._wake.set()
+        if self._task:
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Never let one bad flush end logging for the rest of the process
+                print(f"⚠️ Log flush failed: {e!r}")
+
+    async def flush(self):
+        for guild_id, count in self.dropped.items():
+            self.queues.setdefault(guild_id, deque()).append(f"⚠️ {count} log lines dropped (log queue full).")
+            self.pending += 1
+        self.dropped.clear()
+
+        for guild_id, queue in list(self.queues.items()):
+            gs = settings.guilds.get(guild_id)
+            if gs is None:
+                self.pending -= len(queue)  # Guild was removed from config.json
+                del self.queues[guild_id]
+                continue
+            ch = bot.get_channel(gs.channels["logs"])
+            if not ch:
+                if bot.is_ready():
+                    # Connected, but the channel is gone or was never set up: don't hold on to the lines
+                    print(f"⚠️ Dropped {len(queue)} log lines for guild {guild_id}, log channel {gs.channels['logs']} not found")
+                    self.pending -= len(queue)
+                    del self.queues[guild_id]
+                continue  # Not connected yet, keep the lines until the channel is available
+
+            while queue:
+                # Pack as many whole lines as fit into one message
+                chunk = queue.popleft()
+                self.pending -= 1
+                while queue and len(chunk) + 1 + len(queue[0]) <= MAX_MESSAGE_LEN:
+                    chunk += "\n" + queue.popleft()
+                    self.pending -= 1
+                try:
+                    await ch.send(chunk)
+                except Exception as e:  # HTTP errors, but also dropped connections and timeouts
+                    print(f"⚠️ Failed to send log batch: {e!r}")
+
+log_dispatcher = LogDispatcher(
+    log_cfg.get("flush_interval", 5),
+    log_cfg.get("flush_lines", 20),
+    log_cfg.get("max_queue", 500),
+)
+
+def log(msg, guild=None):
+    # guild: where the line belongs, the primary guild's log channel if not given
+    log_dispatcher.push(guild.id if guild else settings.guild_id, msg)
+
+# Job queue
+# Slow handlers acknowledge the interaction straight away and hand their Discord calls
+# to a small worker pool. Transient HTTP failures are retried with backoff, jobs that
+# share a key run one after another in submission order, and the handler's result is
+# sent as a followup once the job finishes. A timeout doesn't mean Discord didn't apply
+# the request, so only jobs that are safe to run again are retried (retry=True).
+jobs_cfg = config.get("jobs", {})
+
+# run is a coroutine function returning the followup text (or None for no followup)
+Job = namedtuple("Job", ["name", "run", "key", "interaction", "retry"], defaults=[None, None, False])
+
+TRANSIENT_ERRORS = (discord.DiscordServerError, aiohttp.ClientError, asyncio.TimeoutError)
+
+class JobQueue:
+    def __init__(self, workers=4, retries=3, backoff=1.0):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.queue = asyncio.Queue()
+        self._by_key = {}  # key -> jobs (or turn() futures) waiting behind the one currently queued/running
+        self._tasks = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def busy(self, key):
+        # Whether something with this key is queued or running, anything submitted now waits behind it
+        return key in self._by_key
+
+    def submit(self, job):
+        if job.key is None:
+            self.queue.put_nowait(job)
+        else:
+            self._enqueue(job.key, job)
+
+    @contextlib.asynccontextmanager
+    async def turn(self, key):
+        # Runs a block in order with the jobs of the same key, without taking a worker.
+        # Yields whether it had to wait behind one of them.
+        waited = self.busy(key)
+        go = asyncio.get_running_loop().create_future()
+        self._enqueue(key, go)
+        try:
+            await go
+        except asyncio.CancelledError:
+            if go.done() and not go.cancelled():
+                self._finish(key)  # Cancelled right after its turn came
+            raise
+        try:
+            yield waited
+        finally:
+            self._finish(key)
+
+    def _enqueue(self, key, entry):
+        pending = self._by_key.setdefault(key, deque())
+        pending.append(entry)
+        if len(pending) == 1:
+            self._start(key, entry)
+
+    def _start(self, key, entry):
+        if not isinstance(entry, asyncio.Future):
+            self.queue.put_nowait(entry)
+        elif entry.cancelled():
+            self._finish(key)  # Gave up waiting for its turn
+        else:
+            entry.set_result(None)
+
+    def _finish(self, key):
+        pending = self._by_key[key]
+        pending.popleft()
+        if pending:
+            self._start(key, pending[0])
+        else:
+            del self._by_key[key]
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            metrics.inc("vector_jobs_total")
+            try:
+                await self._execute(job)
+            finally:
+                if job.key is not None:
+                    self._finish(job.key)
+
+    async def _execute(self, job):
+        attempt = 0
+        while True:
+            try:
+                result = await job.run()
+            except TRANSIENT_ERRORS as e:
+                if job.retry and attempt < self.retries:
+                    metrics.inc("vector_job_retries_total")
+                    await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+                    attempt += 1
+                    continue
+                print(f"⚠️ {job.name} failed after {attempt + 1} attempts: {e!r}")
+                metrics.inc("vector_jobs_failed_total")
+                result = f"⚠️ {job.name} failed, Discord is having issues. Please try again later."
+            except Exception as e:
+                print(f"⚠️ {job.name} failed: {e!r}")
+                metrics.inc("vector_jobs_failed_total")
+                result = f"⚠️ {job.name} failed."
+            break
+
+        if result and job.interaction:
+            try:
+                await job.interaction.followup.send(result, ephemeral=True)
+            except discord.HTTPException:
+                pass
+
+jobs = JobQueue(jobs_cfg.get("workers", 4), jobs_cfg.get("retries", 3), jobs_cfg.get("backoff", 1.0))
+
+def command_tree_hash(guild):
+    payload = [cmd.to_dict(bot.tree) for cmd in bot.tree.get_commands(guild=guild)]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands(guild):
+    # Only push the command tree when it actually changed since the last sync
+    tree_hash = command_tree_hash(guild)
+    hashes = bot_state.setdefault("command_tree_hashes", {})
+    if hashes.get(str(guild.id)) == tree_hash:
+        return
+    try:
+        synced = await bot.tree.sync(guild=guild)
+        print(f"✅ Synced {len(synced)} slash commands to guild {guild.id}")
+    except Exception as e:
+        print(f"⚠️ Failed to sync commands to guild {guild.id}: {e}")
+        return
+    hashes[str(guild.id)] = tree_hash
+    await save_state()
+
+class VectorBot(commands.AutoShardedBot if gateway_cfg.get("sharded") else commands.Bot):
+    async def setup_hook(self):
+        # Register persistent views
+        self.add_view(TicketPanel())
+        self.add_view(TicketButtons())
+        self.add_view(TicketCloseView())
+
+        for gid in settings.guilds:
+            await sync_commands(discord.Object(id=gid))
+        log_dispatcher.start()
+        jobs.start()
+        for gid in settings.guilds:
+            await open_partition(gid)
+        close_scheduler.start()
+        if retention_cfg.get("enabled", False):
+            retention_sweeper.start()
+        if inactivity_cfg.get("enabled", True):
+            activity_tracker.start()
+        if reload_cfg.get("enabled", True):
+            config_watcher.start()
+        if gateway_cfg.get("report_interval_minutes"):
+            self.memory_report_task = asyncio.create_task(report_memory(gateway_cfg["report_interval_minutes"] * 60))
+        if metrics.enabled:
+            await metrics_exporter.start()
+
+    async def close(self):
+        await activity_tracker.checkpoint()
+        # Flush pending logs while the HTTP session is still open
+        await log_dispatcher.stop()
+        await metrics_exporter.stop()
+        await super().close()
+
+bot = VectorBot(
+    command_prefix="!",
+    intents=intents,
+    # Sent with IDENTIFY, so reconnects don't need a separate presence update
+    status=discord.Status.dnd,
+    activity=discord.Activity(type=discord.ActivityType.watching, name=settings.status),
+    http_trace=http_trace() if metrics.enabled else None,
+    **gateway_options
+)
 
 class TicketPanel(discord.ui.View):
     def __init__(self):
+        # Stable custom_ids so the panel keeps working as a persistent view across restarts
         super().__init__(timeout=None)
 
     # General Tickets
-    @discord.ui.button(label="🎫 General Support", style=discord.ButtonStyle.green)
+    @discord.ui.button(label="🎫 General Support", style=discord.ButtonStyle.green, custom_id="panel_general_support")
     async def general_support(self, i, b): await create_ticket(i, "General Support")
-    @discord.ui.button(label="🐛 Bug Report", style=discord.ButtonStyle.green)
+    @discord.ui.button(label="🐛 Bug Report", style=discord.ButtonStyle.green, custom_id="panel_bug_report")
     async def bug_report(self, i, b): await create_ticket(i, "Bug Report")
-    @discord.ui.button(label="🔪 Player Report", style=discord.ButtonStyle.green)
+    @discord.ui.button(label="🔪 Player Report", style=discord.ButtonStyle.green, custom_id="panel_player_report")
     async def player_report(self, i, b): await create_ticket(i, "Player Report")
-    @discord.ui.button(label="🎥 Media Applications", style=discord.ButtonStyle.green)
+    @discord.ui.button(label="🎥 Media Applications", style=discord.ButtonStyle.green, custom_id="panel_media_app")
     async def media_app(self, i, b): await create_ticket(i, "Media Applications")
 
     # Staff / Store Tickets
-    @discord.ui.button(label="👮‍♂️ Staff Applications", style=discord.ButtonStyle.red)
+    @discord.ui.button(label="👮‍♂️ Staff Applications", style=discord.ButtonStyle.red, custom_id="panel_staff_app")
     async def staff_app(self, i, b): await create_ticket(i, "Staff Applications")
-    @discord.ui.button(label="🔨 Appeal a Punishment", style=discord.ButtonStyle.red)
+    @discord.ui.button(label="🔨 Appeal a Punishment", style=discord.ButtonStyle.red, custom_id="panel_appeal_punishment")
     async def appeal_punishment(self, i, b): await create_ticket(i, "Appeals") 
-    @discord.ui.button(label="❗ Report a Staff Member", style=discord.ButtonStyle.red)
+    @discord.ui.button(label="❗ Report a Staff Member", style=discord.ButtonStyle.red, custom_id="panel_staff_report")
     async def staff_report(self, i, b): await create_ticket(i, "Report a Staff Member")
-    @discord.ui.button(label="🛒 Store Issues", style=discord.ButtonStyle.red)
+    @discord.ui.button(label="🛒 Store Issues", style=discord.ButtonStyle.red, custom_id="panel_store_issue")
     async def store_issue(self, i, b): await create_ticket(i, "Store Issues")
 
+# Ticket admission
+# Overwrite templates are built once per config load (see build_settings) instead of on
+# every click, an index of open tickets per (user, category) rejects duplicates in O(1),
+# and channel creation is funnelled through one queue per guild so a rush of clicks
+# can't trip the rate limit. Index and queue live in the guild's Partition.
+async def load_open_ticket_index(p):
+    for cid, t in (await p.store.open_tickets()).items():
+        p.open_index[(t["user"], t["category"])] = int(cid)
+
+def unindex_ticket(p, cid, t):
+    key = (t["user"], t["category"])
+    if p.open_index.get(key) == int(cid):
+        del p.open_index[key]
+
+class TicketAdmission:
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.waiting = deque()
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def submit(self, interaction, category):
+        self.waiting.append((interaction, category))
+        self._wake.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            while not self.waiting:
+                self._wake.clear()
+                await self._wake.wait()
+
+            interaction, category = self.waiting.popleft()
+            try:
+                await open_ticket(interaction, category)
+            except Exception as e:  # Keep the queue alive whatever a single ticket does
+                partitions[self.guild_id].open_index.pop((interaction.user.id, category), None)
+                print(f"⚠️ Failed to create {category} ticket for {interaction.user}: {e!r}")
+                try:
+                    await interaction.edit_original_response(content="⚠️ Could not create your ticket, please try again.")
+                except discord.HTTPException:
+                    pass
+            # Minimum gap between channel creations in this guild
+            gs = settings.guilds.get(self.guild_id)
+            await asyncio.sleep(gs.tickets.get("create_interval", 0.5) if gs else 0.5)
+
+@instrumented("create_ticket")
 async def create_ticket(interaction, category):
-    guild = interaction.guild
-
-    # Category IDs
-    GENERAL_CATEGORY_ID = config["ticket_categories"]["general_tickets"] 
-    STAFF_CATEGORY_ID = config["ticket_categories"]["staff_store_tickets"] 
-
-    # 1. Determine which category to place the ticket in AND its sensitivity
-    is_sensitive = False
-    if category in ["General Support", "Bug Report", "Player Report", "Media Applications"]:
-        parent_category = guild.get_channel(GENERAL_CATEGORY_ID)
-    elif category in ["Report a Staff Member", "Store Issues", "Appeals", "Staff Applications"]:
-        parent_category = guild.get_channel(STAFF_CATEGORY_ID)
-        is_sensitive = True
+    p = partitions.get(interaction.guild.id)
+    if p is None or interaction.guild.id not in settings.guilds:
+        return await interaction.response.send_message("Tickets are not set up in this server.", ephemeral=True)
+    key = (interaction.user.id, category)
+
+    # 1. One open ticket per user and category
+    if key in p.open_index:
+        existing = p.open_index[key]
+        if existing is None:
+            return await interaction.response.send_message("Your ticket is already being created.", ephemeral=True)
+        if interaction.guild.get_channel(existing):
+            return await interaction.response.send_message(f"You already have an open {category} ticket: <#{existing}>", ephemeral=True)
+        # Channel was deleted outside the bot, let them open a new one
+
+    # 2. Reserve the slot and queue the channel creation
+    p.open_index[key] = None
+    position = len(p.admission.waiting) + 1
+    if position == 1:
+        await interaction.response.send_message("Creating your ticket...", ephemeral=True)
     else:
-        parent_category = None  # fallback to guild root if needed
+        await interaction.response.send_message(f"You're #{position} in the ticket queue, your ticket will be created shortly.", ephemeral=True)
+    p.admission.submit(interaction, category)
 
+@instrumented("open_ticket")
+async def open_ticket(interaction, category):
+    guild = interaction.guild
+    gs, p = settings.guilds[guild.id], partitions[guild.id]
+    template = gs.ticket_templates.get(category, gs.fallback_template)
+
+    # 1. Resolve the precomputed template for this guild
     overwrites = {
-        guild.default_role: discord.PermissionOverwrite(view_channel=False),
-        interaction.user: discord.PermissionOverwrite(view_channel=True, send_messages=True)
+        guild.default_role: HIDDEN,
+        interaction.user: VIEW_AND_SEND
     }
+    for rid in template.role_ids:
+        role = guild.get_role(rid)
+        if role: overwrites[role] = VIEW_AND_SEND
+    parent_category = guild.get_channel(template.parent_id) if template.parent_id else None
+    staff_role = guild.get_role(gs.roles["staff"])
 
-    # 2. Add roles based on ticket type
-
-    # Add generic 'staff' role access for ALL General Tickets
-    staff_role = guild.get_role(config["public_roles"]["staff"])
-    if not is_sensitive and staff_role:
-        overwrites[staff_role] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
-    
-            
-    # Staff/Store Tickets: Only Sr Admin+ can see these (Crucial for restriction)
-    elif category in ["Report a Staff Member","Store Issues", "Appeals", "Staff Applications"]:
-        for role_key in ["admin","sr_admin","manager","owner"]:
-            role = guild.get_role(config["public_roles"].get(role_key))
-            if role: overwrites[role] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
-
-    # 4. Create ticket channel
+    # 2. Create ticket channel
     ch_name = interaction.user.name.lower()
-    ch = await guild.create_text_channel(ch_name, overwrites=overwrites, topic=f"Ticket by {interaction.user.id}", category=parent_category)
+    with metrics.timer("vector_ticket_open_step_seconds", step="create_channel"):
+        ch = await guild.create_text_channel(ch_name, overwrites=overwrites, topic=f"Ticket by {interaction.user.id}", category=parent_category)
 
-    ticket_data[str(ch.id)] = {"user": interaction.user.id, "category": category, "claimed": False}
-    save_data()
-    await log(f"🎟️ {interaction.user} opened a {category} ticket.")
+    assignee = p.claims.pick(guild, category) if CLAIMS_AUTO_ASSIGN else None
 
     embed = discord.Embed(
         title=f"{category} Ticket",
@@ -120,135 +1169,1113 @@ async def create_ticket(interaction, category):
     view = TicketButtons()
     
 
-    mention_content = f"{staff_role.mention} | {interaction.user.mention}"
+    # Only ping the assigned staff member, everyone if nobody could be assigned
+    if assignee:
+        embed.set_footer(text=f"Assigned to {assignee.display_name}")
+        mention_content = f"{assignee.mention} | {interaction.user.mention}"
+    else:
+        mention_content = f"{staff_role.mention} | {interaction.user.mention}"
         
-    await ch.send(content=mention_content, embed=embed, view=view)
-    await interaction.response.send_message("Ticket created.", ephemeral=True)
+    # 3. Welcome message. The ticket is only recorded once it's sent, if anything fails
+    # before that the channel is removed again instead of being left behind as an orphan
+    try:
+        with metrics.timer("vector_ticket_open_step_seconds", step="welcome_message"):
+            await ch.send(content=mention_content, embed=embed, view=view)
+    except Exception:
+        with contextlib.suppress(discord.HTTPException):
+            await ch.delete(reason="Ticket setup failed")
+        raise
+
+    # 4. Record the ticket
+    with metrics.timer("vector_ticket_open_step_seconds", step="record"):
+        now = time.time()
+        t = {"user": interaction.user.id, "category": category, "claimed": False, "created_at": now, "last_activity": now}
+        if assignee:
+            t["claimed"] = assignee.id
+        p.store.put(str(ch.id), t)
+        p.claims.add(ch.id, t)
+        p.open_index[(interaction.user.id, category)] = ch.id
+        p.search.index_ticket(ch.id, t, name=f"{ch.name} {interaction.user}")
+        activity_tracker.track(ch.id, category, t["created_at"], guild.id)
+    log(f"🎟️ {interaction.user} opened a {category} ticket.", guild)
+
+    # The ticket is complete either way, the interaction may have expired while it was queued
+    with contextlib.suppress(discord.HTTPException):
+        await interaction.edit_original_response(content=f"Ticket created: {ch.mention}")
+
+# Claims
+# Every open ticket is either in the unclaimed queue or counted towards the load of the
+# staff member who claimed it. New tickets can be auto-assigned to the least loaded staff
+# member allowed to see them (the same roles the ticket's overwrite template grants).
+# Every guild has its own ClaimIndex, in its Partition.
+claims_cfg = config.get("claims", {})
+CLAIMS_AUTO_ASSIGN = claims_cfg.get("auto_assign", False)
+
+def ticket_template(guild_id, category):
+    gs = settings.guilds[guild_id]
+    return gs.ticket_templates.get(category, gs.fallback_template)
+
+def can_handle(member, category):
+    # The roles the ticket's overwrite template grants, resolved like a permission
+    return has_any_role(member, ticket_template(member.guild.id, category).role_ids)
+
+class ClaimIndex:
+    def __init__(self, store):
+        self.store = store
+        self.staff_load = Counter()  # staff id -> open tickets claimed
+        self.unclaimed = {}  # channel id -> ticket record, oldest first
+
+    async def load(self):
+        for cid, t in (await self.store.open_tickets()).items():
+            self.add(int(cid), t)
+
+    def add(self, cid, t):
+        if t.get("claimed"):
+            self.staff_load[t["claimed"]] += 1
+        else:
+            self.unclaimed[cid] = t
+
+    def remove(self, cid, t):
+        if t.get("claimed"):
+            self.staff_load[t["claimed"]] -= 1
+            if self.staff_load[t["claimed"]] <= 0:
+                del self.staff_load[t["claimed"]]
+        self.unclaimed.pop(cid, None)
+
+    def claim(self, cid, t, staff_id):
+        self.remove(cid, t)
+        t["claimed"] = staff_id
+        self.store.update(str(cid), claimed=staff_id)
+        self.add(cid, t)
+
+    def pick(self, guild, category):
+        candidates = {
+            m for rid in ticket_template(guild.id, category).role_ids
+            if (role := guild.get_role(rid)) for m in role.members if not m.bot
+        }
+        if not candidates:
+            return None
+        return min(candidates, key=lambda m: (self.staff_load[m.id], random.random()))
+
+# Close scheduler
+# Pending closures live in the ticket record (close_at/close_by/close_message) so they
+# survive a restart, and one timer task walks a min-heap of deadlines for all of them.
+# The countdown itself is a Discord relative timestamp, rendered client side.
+class CloseScheduler:
+    def __init__(self):
+        self.heap = []  # (deadline, channel id, guild id), cancelled entries are skipped when they come due
+        self._wake = asyncio.Event()
+        self._task = None
+
+    async def load(self, p):
+        # The close button stays usable after archiving, so archived tickets can have a pending close too
+        for cid, t in (await p.store.pending_closes()).items():
+            heapq.heappush(self.heap, (t["close_at"], cid, p.guild_id))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def schedule(self, p, cid, t, deadline, user_id, message_id):
+        t.update(close_at=deadline, close_by=user_id, close_message=message_id)
+        p.store.update(cid, close_at=deadline, close_by=user_id, close_message=message_id)
+        heapq.heappush(self.heap, (deadline, cid, p.guild_id))
+        self._wake.set()
+
+    def cancel(self, p, cid, t):
+        for key in ("close_at", "close_by", "close_message"):
+            t.pop(key, None)
+        p.store.update(cid, close_at=None, close_by=None, close_message=None)
+
+    async def _run(self):
+        await bot.wait_until_ready()
+        while True:
+            self._wake.clear()
+            if not self.heap or self.heap[0][0] > time.time():
+                timeout = self.heap[0][0] - time.time() if self.heap else None
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            deadline, cid, guild_id = heapq.heappop(self.heap)
+            p = partitions.get(guild_id)
+            t = await p.store.get(cid) if p else None
+            if not t or t.get("close_at") != deadline:
+                continue  # Cancelled or rescheduled since
+            self._close(p, cid, t)
+
+    def _close(self, p, cid, t):
+        user_id, message_id = t.get("close_by"), t.get("close_message")
+        self.cancel(p, cid, t)  # Clear the pending close before archive_ticket saves the record
+
+        channel = bot.get_channel(int(cid))
+        if not channel:
+            return  # Deleted while the countdown was running
+        user = channel.guild.get_member(user_id) or f"<@{user_id}>"
+
+        async def run():
+            if message_id:
+                await channel.get_partial_message(message_id).edit(content="Archiving ticket now...", view=None)
+            await archive_ticket(channel, user)
+
+        jobs.submit(Job(f"Archiving {channel.name}", run, key=cid, retry=True))
+
+close_scheduler = CloseScheduler()
 
 class TicketCloseView(discord.ui.View):
     def __init__(self):
-        # Set a timeout just to prevent the view from lingering too long if not used
-        super().__init__(timeout=60) 
-        self.cancelled = False
+        # Persistent so the cancel button keeps working across restarts
+        super().__init__(timeout=None)
 
-    @discord.ui.button(label="❌ Cancel Close", style=discord.ButtonStyle.grey)
+    @discord.ui.button(label="❌ Cancel Close", style=discord.ButtonStyle.grey, custom_id="ticket_close_cancel")
+    @instrumented("ticket_close_cancel")
     async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # 1. Set the flag to true to stop the countdown loop
-        self.cancelled = True
-        
+        cid = str(interaction.channel.id)
+        p, t = await get_ticket(interaction.channel)
+        if not t or not t.get("close_at"):
+            return await interaction.response.send_message("This ticket is not closing.", ephemeral=True)
+
+        # 1. Drop the pending close, the timer skips its heap entry when it comes due
+        close_scheduler.cancel(p, cid, t)
+
         # 2. Disable the button and update the message
-        for child in self.children:
-            if isinstance(child, discord.ui.Button):
-                child.disabled = True
-        
+        button.disabled = True
         await interaction.response.edit_message(content="**Ticket closing CANCELLED.** You can close it again later.", view=self)
-        self.stop() # Stop the view to clean up resources
 
 class TicketButtons(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
 
+    @discord.ui.button(label="Claim Ticket", style=discord.ButtonStyle.green, custom_id="ticket_claim")
+    @instrumented("ticket_claim")
+    async def claim(self, interaction: discord.Interaction, button: discord.ui.Button):
+        cid = interaction.channel.id
+        p, t = await get_ticket(interaction.channel)
+        if not t or t.get("archived"):
+            return await interaction.response.send_message("This ticket can't be claimed.", ephemeral=True)
+        if not can_handle(interaction.user, t["category"]):
+            return await interaction.response.send_message("You do not have permission to claim this ticket.", ephemeral=True)
+        if t.get("claimed") == interaction.user.id:
+            return await interaction.response.send_message("You already claimed this ticket.", ephemeral=True)
+
+        previous = t.get("claimed")
+        p.claims.claim(cid, t, interaction.user.id)
+
+        if previous:
+            await interaction.response.send_message(f"🙋 {interaction.user.mention} took over this ticket from <@{previous}>.")
+        else:
+            await interaction.response.send_message(f"🙋 {interaction.user.mention} claimed this ticket.")
+        log(f"🙋 {interaction.user} claimed ticket {interaction.channel.name}.", interaction.guild)
+
     @discord.ui.button(label="Close Ticket", style=discord.ButtonStyle.red, custom_id="ticket_close")
+    @instrumented("ticket_close")
     async def close(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Roles allowed to close (Permission check for INITIATING closure)
-        allowed_roles = ["manager", "admin", "sr_admin", "owner", "sr_mod", "mod"]
-        user_roles = [r.id for r in interaction.user.roles]
-        allowed = False
-        for role_key in allowed_roles:
-            role_id = config["public_roles"].get(role_key)
-            if role_id in user_roles:
-                allowed = True
-                break
-        if not allowed:
+        # Permission check for INITIATING closure
+        if not has_permission(interaction.user, "close_ticket"):
             return await interaction.response.send_message("You do not have permission to close this ticket.", ephemeral=True)
 
-        # 1. Instantiate the new countdown view
-        countdown_view = TicketCloseView()
-        
-        # 2. FIX: Send a new public message (not ephemeral) to start the countdown
-        # This message will contain the cancel button.
-        await interaction.response.send_message(
-            content="⚠️ **Ticket Closure Initiated!** Closing in 10 seconds...",
-            view=countdown_view,
+        cid = str(interaction.channel.id)
+        p, t = await get_ticket(interaction.channel)
+        if not t:
+            return await interaction.response.send_message("This channel is not a ticket.", ephemeral=True)
+        if t.get("close_at"):
+            return await interaction.response.send_message("This ticket is already closing.", ephemeral=True)
+
+        # 1. Send the countdown once, Discord renders the relative timestamp live
+        deadline = int(time.time()) + settings.guilds[interaction.guild.id].tickets.get("close_delay", 10)
+        response = await interaction.response.send_message(
+            content=f"⚠️ **Ticket Closure Initiated!** Closing <t:{deadline}:R>...",
+            view=TicketCloseView(),
             ephemeral=False # Set to False to make it a regular channel message
         )
 
-        # 3. 10 second countdown
-        for sec in range(9, 0, -1): # Start at 9 since 10 was used in the initial message
-            if countdown_view.cancelled:
-                # If cancelled by the button, the TicketCloseView handles the message edit, so we just exit.
-                return 
-                
-            # Use edit_original_response to update the NEW message (the countdown message)
-            await interaction.edit_original_response(content=f"Closing in {sec}...")
-            await asyncio.sleep(1)
-
-        # Check cancellation one last time after the loop finishes
-        if countdown_view.cancelled:
-            return
-            
-        # Final message update before archiving
-        await interaction.edit_original_response(content="Archiving ticket now...", view=None)
+        # 2. Hand it to the scheduler, which archives the ticket when the deadline passes
+        close_scheduler.schedule(p, cid, t, deadline, interaction.user.id, response.message_id)
+
+
+# Archive categories
+# Discord caps a category at 50 channels. Once the primary archive category is full,
+# archived tickets spill into overflow categories that are created on demand (and
+# removed again by the retention sweeper once they're empty).
+CATEGORY_CHANNEL_LIMIT = 50
+archive_locks = defaultdict(asyncio.Lock)  # guild id -> lock, one guild's overflow never holds up another
+archive_reserved = Counter()  # category id -> archives currently moving into it
+
+async def reserve_archive_category(guild):
+    gs = settings.guilds.get(guild.id)
+    primary = guild.get_channel(gs.categories.get("archived")) if gs else None
+    if primary is None:
+        return None
+
+    async with archive_locks[guild.id]:
+        overflow = guild_state(guild.id).setdefault("archive_overflow", [])
+        for cat in [primary] + [guild.get_channel(cid) for cid in overflow]:
+            if cat and len(cat.channels) + archive_reserved[cat.id] < CATEGORY_CHANNEL_LIMIT:
+                archive_reserved[cat.id] += 1
+                return cat
+
+        # Everything is full, open another overflow category next to the primary one
+        cat = await guild.create_category(
+            f"{primary.name} {len(overflow) + 2}",
+            overwrites=primary.overwrites,
+            position=primary.position + len(overflow) + 1,
+            reason="Archived tickets overflow"
+        )
+        overflow.append(cat.id)
+        await save_state()
+        archive_reserved[cat.id] += 1
+        return cat
 
-        # 4. Handle Archive logic
-        await archive_ticket(interaction.channel, interaction.user)
-        # Use a follow-up to confirm the action, visible only to the staff member
-        await interaction.followup.send("Ticket successfully archived.", ephemeral=True)
+@instrumented("archive_ticket")
+async def archive_ticket(channel, user):
+    # Safe to run again (archive jobs are retried): a channel that was already moved is
+    # not renamed or logged twice, only its record is completed
+    if not channel.name.startswith("archived-"):
+        archive_category = await reserve_archive_category(channel.guild)
+
+        log(f"📦 Ticket {channel.name} archived by {user}.", channel.guild)
+
+        # FIX: Set sync_permissions=True to inherit permissions from the category
+        try:
+            await channel.edit(
+                category=archive_category,
+                name=f"archived-{channel.name}",
+                sync_permissions=True # <-- This is the key
+            )
+        finally:
+            if archive_category:
+                archive_reserved[archive_category.id] -= 1
+
+    p, t = await get_ticket(channel)
+    if t and not t.get("archived"):
+        archived = {"archived": True, "archived_at": time.time(),
+                    "archived_by": getattr(user, "id", None), "archived_by_name": str(user)}
+        t.update(archived)
+        p.store.update(str(channel.id), **archived)
+        unindex_ticket(p, channel.id, t)
+        p.claims.remove(channel.id, t)
+        p.search.index_ticket(channel.id, t)
+    activity_tracker.untrack(channel.id)
+
+
+@instrumented("close_ticket")
+async def close_ticket(channel, user):
+    p, t = await get_ticket(channel)
+    await export_transcript(channel, t)
+    log(f"🗑️ Ticket {channel.name} closed by {user}.", channel.guild)
+    if t:
+        unindex_ticket(p, channel.id, t)
+        if not t.get("archived"):
+            p.claims.remove(channel.id, t)
+        p.store.delete(str(channel.id))
+    activity_tracker.untrack(channel.id)
+    await channel.delete()
 
+# Transcripts
+# Before a ticket channel is deleted its history is streamed page by page into a
+# gzip-compressed JSONL file: one header line with the ticket record, then one line per
+# message. Only a page of messages is ever held in memory, whatever the channel size.
+# Every guild's transcripts go to its own subdirectory.
+transcript_cfg = config.get("transcripts", {})
+TRANSCRIPT_DIR = transcript_cfg.get("dir", "transcripts")
+TRANSCRIPT_PAGE = 100  # Same page size channel.history() fetches with
+
+def transcript_path(guild_id, channel_id):
+    return os.path.join(TRANSCRIPT_DIR, str(guild_id), f"{channel_id}.jsonl.gz")
+
+def transcript_message(msg):
+    return {
+        "type": "message",
+        "id": msg.id,
+        "author_id": msg.author.id,
+        "author": str(msg.author),
+        "created_at": msg.created_at.isoformat(),
+        "edited_at": msg.edited_at.isoformat() if msg.edited_at else None,
+        "content": msg.content,
+        "attachments": [
+            {"id": a.id, "filename": a.filename, "size": a.size, "content_type": a.content_type, "url": a.url}
+            for a in msg.attachments
+        ],
+        "embeds": [e.to_dict() for e in msg.embeds],
+    }
 
+def open_transcript(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return gzip.open(path, "wt", encoding="utf-8")
 
-async def archive_ticket(channel, user):
-    guild = channel.guild
-    archive_category = guild.get_channel(config["ticket_categories"]["archived"])
+@instrumented("export_transcript")
+async def export_transcript(channel, t=None):
+    path = transcript_path(channel.guild.id, channel.id)
+    tmp = path + ".tmp"
+    out = await asyncio.to_thread(open_transcript, tmp)
+    try:
+        header = {
+            "type": "ticket",
+            "channel_id": channel.id,
+            "guild_id": channel.guild.id,
+            "name": channel.name,
+            "ticket": t,
+            "exported_at": time.time(),
+        }
+        page = [json.dumps(header)]
+        async for msg in channel.history(limit=None, oldest_first=True):
+            page.append(json.dumps(transcript_message(msg)))
+            if len(page) >= TRANSCRIPT_PAGE:
+                await asyncio.to_thread(out.write, "\n".join(page) + "\n")
+                page = []
+        if page:
+            await asyncio.to_thread(out.write, "\n".join(page) + "\n")
+    except BaseException:
+        await asyncio.to_thread(out.close)
+        os.remove(tmp)
+        raise
+    await asyncio.to_thread(out.close)
+    os.replace(tmp, path)  # Only a complete transcript ever shows up under the final name
+    if channel.guild.id in partitions:
+        partitions[channel.guild.id].search.index_transcript(path)
+    return path
+
+# Ticket search
+# A local SQLite FTS5 index with one document per ticket (rowid = channel id): the ticket
+# metadata plus, once exported, the whole transcript. It is updated as tickets are
+# opened, archived and exported, and any transcripts it hasn't seen yet are picked up
+# in the background at startup. Every guild has its own index (see Partition), so a search
+# never sees another guild's tickets. Writes (including the backfill) run on one thread,
+# searches on their own thread and read connection, so indexing never holds up a query.
+search_cfg = config.get("search", {})
+SEARCH_PAGE_SIZE = search_cfg.get("page_size", 10)
+
+class TicketSearchIndex:
+    COLUMNS = ["name", "user", "category", "archived_by", "content"]
+
+    def __init__(self, db_path, transcript_dir):
+        self.db_path = db_path
+        self.transcript_dir = transcript_dir
+        self._db = None
+        self._read_db = None
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ticket-search",
+                                          initializer=self._connect)
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ticket-search-read",
+                                          initializer=self._connect_reader)
+        self._worker.submit(self._create_schema).result()
+        self._worker.submit(self._backfill)
+
+    def _connect(self):
+        self._db = sqlite3.connect(self.db_path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+
+    def _connect_reader(self):
+        # WAL lets this connection read the last committed state while the writer works
+        self._read_db = sqlite3.connect(self.db_path, isolation_level=None)
+
+    def _create_schema(self):
+        self._db.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS ticket_search USING fts5(
+                name, user, category, archived_by, content,
+                tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS indexed_transcripts (
+                path  TEXT PRIMARY KEY,
+                mtime REAL NOT NULL
+            );
+        """)
+
+    # Writer thread
+
+    def _upsert(self, cid, fields):
+        # FTS5 has no upsert, so merge with the existing row and replace it
+        row = self._db.execute(f"SELECT {', '.join(self.COLUMNS)} FROM ticket_search WHERE rowid = ?", (cid,)).fetchone()
+        values = dict(zip(self.COLUMNS, row)) if row else dict.fromkeys(self.COLUMNS, "")
+        values.update({k: v for k, v in fields.items() if v is not None})
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM ticket_search WHERE rowid = ?", (cid,))
+            self._db.execute(f"INSERT INTO ticket_search (rowid, {', '.join(self.COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                             (cid, *[values[c] for c in self.COLUMNS]))
+
+    @staticmethod
+    def _ticket_fields(t):
+        if not t:
+            return {}
+        return {
+            "user": str(t["user"]),
+            "category": t["category"],
+            "archived_by": f"{t.get('archived_by_name', '')} {t.get('archived_by') or ''}".strip() or None,
+        }
+
+    def _index_transcript(self, path):
+        try:
+            lines = []
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                header = json.loads(next(f))
+                for line in f:
+                    m = json.loads(line)
+                    parts = [m["content"]]
+                    parts += [a["filename"] for a in m["attachments"]]
+                    parts += [e.get("title", "") + " " + e.get("description", "") for e in m["embeds"]]
+                    lines.append(f"{m['author']}: {' '.join(p for p in parts if p)}")
+
+            fields = self._ticket_fields(header.get("ticket"))
+            fields.update(name=header["name"], content="\n".join(lines))
+            self._upsert(header["channel_id"], fields)
+            self._db.execute("INSERT OR REPLACE INTO indexed_transcripts VALUES (?, ?)", (path, os.path.getmtime(path)))
+        except (OSError, ValueError, KeyError, StopIteration, sqlite3.Error) as e:
+            print(f"⚠️ Failed to index transcript {path}: {e}")
+
+    def _backfill(self):
+        if not os.path.isdir(self.transcript_dir):
+            return
+        # Matched by file name, so moving the transcript directory doesn't trigger a full re-index
+        seen = {os.path.basename(path): mtime for path, mtime in self._db.execute("SELECT path, mtime FROM indexed_transcripts")}
+        for entry in os.scandir(self.transcript_dir):
+            if entry.name.endswith(".jsonl.gz") and seen.get(entry.name) != entry.stat().st_mtime:
+                self._index_transcript(entry.path)
+
+    def _search(self, match, include_sensitive, limit, offset):
+        where = "ticket_search MATCH ?"
+        params = [match]
+        if not include_sensitive:
+            where += f" AND category NOT IN ({', '.join('?' * len(SENSITIVE_TICKETS))})"
+            params += SENSITIVE_TICKETS
+        total = self._read_db.execute(f"SELECT count(*) FROM ticket_search WHERE {where}", params).fetchone()[0]
+        rows = self._read_db.execute(
+            f"SELECT rowid, name, user, category, archived_by, snippet(ticket_search, 4, '**', '**', '…', 12) "
+            f"FROM ticket_search WHERE {where} ORDER BY rank LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return total, rows
+
+    # Queued from the event loop
+
+    def index_ticket(self, cid, t, name=None):
+        fields = self._ticket_fields(t)
+        fields["name"] = name
+        self._worker.submit(self._upsert, int(cid), fields)
+
+    def index_transcript(self, path):
+        self._worker.submit(self._index_transcript, path)
+
+    async def search(self, query, include_sensitive, page):
+        # Quote every word so user input can't produce FTS syntax errors, prefix-match the last one
+        words = re.findall(r"\w+", query)
+        if not words:
+            return 0, []
+        match = " ".join(f'"{w}"' for w in words) + "*"
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader, self._search, match, include_sensitive,
+                                          SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
+
+    def close(self):
+        self._reader.submit(lambda: self._read_db.close())
+        self._reader.shutdown(wait=True)
+        self._worker.submit(self._db.close)
+        self._worker.shutdown(wait=True)
+
+def search_embed(query, page, total, rows):
+    pages = max(1, -(-total // SEARCH_PAGE_SIZE))
+    embed = discord.Embed(title=f"🔎 Ticket search: {query}"[:256], color=0x00AAEE)
+    if not rows:
+        embed.description = "No tickets found."
+    for cid, name, user, category, archived_by, snippet in rows:
+        status = f"archived by {archived_by}" if archived_by else "open"
+        embed.add_field(
+            name=f"{name} · {category}"[:256],
+            value=f"<#{cid}> · <@{user}> · {status}\n{snippet}"[:1024],
+            inline=False
+        )
+    embed.set_footer(text=f"Page {page + 1}/{pages} · {total} tickets")
+    return embed
+
+class SearchResultsView(discord.ui.View):
+    def __init__(self, index, query, include_sensitive, total):
+        super().__init__(timeout=300)
+        self.index = index
+        self.query = query
+        self.include_sensitive = include_sensitive
+        self.total = total
+        self.page = 0
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.prev_page.disabled = self.page == 0
+        self.next_page.disabled = (self.page + 1) * SEARCH_PAGE_SIZE >= self.total
+
+    async def show(self, interaction, page):
+        self.page = page
+        self.total, rows = await self.index.search(self.query, self.include_sensitive, page)
+        self.update_buttons()
+        await interaction.response.edit_message(embed=search_embed(self.query, page, self.total, rows), view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.grey)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page - 1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.grey)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page + 1)
+
+# Retention
+# A periodic sweep deletes archived tickets past the configured age, and the oldest
+# ones beyond the configured count, a few at a time. Transcripts are exported first
+# unless disabled. Each guild is swept on its own, and only while it is available.
+# Deleting channels can't be undone, so the sweeper only runs once retention.enabled is set.
+retention_cfg = config.get("retention", {})
+
+class RetentionSweeper:
+    def __init__(self, max_age_days=30, max_archived=0, interval_minutes=60, concurrency=3, export=True):
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.max_archived = max_archived  # 0 = no count limit
+        self.interval = interval_minutes * 60
+        self.concurrency = concurrency
+        self.export = export
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        await bot.wait_until_ready()
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"⚠️ Retention sweep failed: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self):
+        for p in list(partitions.values()):
+            guild = bot.get_guild(p.guild_id)
+            if guild and not guild.unavailable:
+                await self.sweep_guild(p, guild)
+
+    async def sweep_guild(self, p, guild):
+        cutoff = time.time() - self.max_age if self.max_age else None
+        expired = await p.store.expired_archives(self.max_archived, cutoff)
+
+        if expired:
+            limiter = asyncio.Semaphore(self.concurrency)
+            results = await asyncio.gather(*(self._expire(limiter, p, guild, cid, t) for cid, t in expired.items()))
+            log(f"🧹 Retention sweep deleted {sum(results)}/{len(expired)} archived tickets.", guild)
+
+        await self._drop_empty_overflow(guild)
+
+    async def _expire(self, limiter, p, guild, cid, t):
+        async with limiter:
+            channel = guild.get_channel(int(cid))
+            try:
+                if channel:
+                    if self.export:
+                        await export_transcript(channel, t)
+                    await channel.delete(reason="Archived ticket retention")
+            except (discord.HTTPException, OSError) as e:
+                print(f"⚠️ Failed to expire archived ticket {cid}: {e}")
+                return False
+            p.store.delete(cid)
+            return True
+
+    async def _drop_empty_overflow(self, guild):
+        async with archive_locks[guild.id]:
+            state = guild_state(guild.id)
+            overflow = state.get("archive_overflow", [])
+            keep = []
+            for cid in overflow:
+                cat = guild.get_channel(cid)
+                if cat and (cat.channels or archive_reserved[cid]):
+                    keep.append(cid)
+                    continue
+                try:
+                    if cat:
+                        await cat.delete(reason="Archived tickets overflow no longer needed")
+                except discord.HTTPException:
+                    keep.append(cid)
+            if keep != overflow:
+                state["archive_overflow"] = keep
+                await save_state()
+
+retention_sweeper = RetentionSweeper(
+    retention_cfg.get("max_age_days", 30),
+    retention_cfg.get("max_archived", 0),
+    retention_cfg.get("interval_minutes", 60),
+    retention_cfg.get("concurrency", 3),
+    retention_cfg.get("export", True),
+)
 
-    await log(f"📦 Ticket {channel.name} archived by {user}.")
-    
-    # FIX: Set sync_permissions=True to inherit permissions from the category
-    await channel.edit(
-        category=archive_category, 
-        name=f"archived-{channel.name}",
-        sync_permissions=True # <-- This is the key
-    )
-    
-    if str(channel.id) in ticket_data:
-        ticket_data[str(channel.id)]["archived"] = True
-        save_data()
+# Inactivity
+# on_message only stamps the time into an in-memory map for open ticket channels (no API
+# calls). A heap of deadlines, re-armed lazily when it finds newer activity, warns the
+# ticket creator after the idle threshold configured per category, and archives the
+# ticket only if nobody replied within close_after_hours - warn_after_hours of that
+# warning (at least min_notice_minutes). A ticket is never archived without a warning.
+# Activity and warnings are kept in the ticket records, so a restart neither re-warns
+# nor loses a warning that was already sent.
+inactivity_cfg = config.get("inactivity", {})
+
+class ActivityTracker:
+    def __init__(self, categories, checkpoint_minutes=5, min_notice_minutes=60):
+        self.categories = categories  # category -> {"warn_after_hours", "close_after_hours"}, plus "default"
+        self.checkpoint_interval = checkpoint_minutes * 60
+        self.min_notice = min_notice_minutes * 60
+        self.last = {}  # channel id -> last activity timestamp, open tickets only
+        self.category = {}  # channel id -> ticket category
+        self.guild = {}  # channel id -> guild id, for the checkpoint
+        self.warned = {}  # channel id -> when the inactivity warning was sent
+        self.dirty = set()  # channel ids with activity not yet checkpointed
+        self.heap = []  # (deadline, channel id)
+        self._wake = asyncio.Event()
+        self._tasks = []
+
+    def thresholds(self, category):
+        # (idle seconds before the warning, seconds from the warning to archiving), or None
+        c = self.categories.get(category, self.categories.get("default", {}))
+        close = c.get("close_after_hours", 0) * 3600
+        if not close:
+            return None
+        warn = c.get("warn_after_hours", 0) * 3600
+        if not 0 < warn < close:
+            warn = close  # No earlier warning configured, warn once close_after_hours is reached
+        return warn, max(close - warn, self.min_notice)
+
+    def next_deadline(self, cid):
+        thresholds = self.thresholds(self.category[cid])
+        if thresholds is None:
+            return None
+        warn, notice = thresholds
+        if cid in self.warned:
+            return self.warned[cid] + notice
+        return self.last[cid] + warn
+
+    async def load(self, p):
+        now = time.time()
+        for cid, t in (await p.store.open_tickets()).items():
+            # Tickets from before activity tracking have no last_activity. They count as
+            # active from now on, their age says nothing about when someone last replied.
+            self.track(int(cid), t["category"], t.get("last_activity") or now, p.guild_id, t.get("inactivity_warned_at"))
+            if not t.get("last_activity"):
+                self.dirty.add(int(cid))
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._checkpoint_loop())]
+
+    def track(self, cid, category, ts, guild_id, warned_at=None):
+        self.last[cid] = ts
+        self.category[cid] = category
+        self.guild[cid] = guild_id
+        if warned_at and warned_at >= ts:
+            self.warned[cid] = warned_at
+        deadline = self.next_deadline(cid)
+        if deadline:
+            heapq.heappush(self.heap, (deadline, cid))
+            self._wake.set()
+
+    def untrack(self, cid):
+        self.last.pop(cid, None)
+        self.category.pop(cid, None)
+        self.guild.pop(cid, None)
+        self.warned.pop(cid, None)
+        self.dirty.discard(cid)
+
+    def touch(self, cid, ts):
+        # Hot path, runs for every message in the guild
+        if cid in self.last:
+            self.last[cid] = ts
+            self.warned.pop(cid, None)
+            self.dirty.add(cid)
+
+    async def _run(self):
+        await bot.wait_until_ready()
+        while True:
+            self._wake.clear()
+            timeout = self.process_due()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def process_due(self):
+        # Warns or archives every ticket whose deadline has passed, returns the seconds until the next one
+        while self.heap and self.heap[0][0] <= time.time():
+            _, cid = heapq.heappop(self.heap)
+            if cid not in self.last:
+                continue  # Archived or closed since
+            deadline = self.next_deadline(cid)
+            if deadline is None:
+                continue
+            if deadline > time.time():
+                heapq.heappush(self.heap, (deadline, cid))  # Someone spoke since, re-arm
+                continue
+
+            if cid in self.warned:
+                self._archive(cid)  # Warned and nobody replied since
+                continue
+            now = time.time()
+            self.warned[cid] = now
+            p = partitions.get(self.guild[cid])
+            if p:
+                p.store.update(str(cid), inactivity_warned_at=now)
+            deadline = self.next_deadline(cid)
+            heapq.heappush(self.heap, (deadline, cid))
+            self._warn(cid, int(deadline), int(now - self.last[cid]))
+        return self.heap[0][0] - time.time() if self.heap else None
+
+    def _warn(self, cid, close_at, idle):
+        channel = bot.get_channel(cid)
+        if not channel:
+            return self.untrack(cid)
+
+        async def run():
+            _, t = await get_ticket(channel)
+            mention = f"<@{t['user']}>" if t else ""
+            await channel.send(f"⏰ {mention} This ticket has had no activity for {idle // 3600:.0f} hours "
+                               f"and will be archived <t:{close_at}:R> unless someone replies.")
+
+        jobs.submit(Job(f"Inactivity warning for {channel.name}", run, key=str(cid)))
+
+    def _archive(self, cid):
+        channel = bot.get_channel(cid)
+        self.untrack(cid)
+        if not channel:
+            return
 
+        async def run():
+            await archive_ticket(channel, bot.user)
 
-async def close_ticket(channel, user):
-    await log(f"🗑️ Ticket {channel.name} closed by {user}.")
-    ticket_data.pop(str(channel.id), None)
-    save_data()
-    await channel.delete()
+        log(f"💤 Ticket {channel.name} is being archived for inactivity.", channel.guild)
+        jobs.submit(Job(f"Archiving {channel.name}", run, key=str(cid), retry=True))
 
-# Commands
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await self.checkpoint()
 
-@bot.tree.command(name="deleteticket", guild=GUILD)
-async def deleteticket(i: discord.Interaction):
+    async def checkpoint(self):
+        dirty, self.dirty = self.dirty, set()
+        for cid in dirty:
+            p = partitions.get(self.guild.get(cid))
+            if p and cid in self.last:
+                p.store.update(str(cid), last_activity=self.last[cid], inactivity_warned_at=self.warned.get(cid))
+
+activity_tracker = ActivityTracker(
+    inactivity_cfg.get("categories", {}),
+    inactivity_cfg.get("checkpoint_minutes", 5),
+    inactivity_cfg.get("min_notice_minutes", 60),
+)
+
+@bot.listen("on_message")
+async def track_ticket_activity(message):
+    if not message.author.bot:
+        activity_tracker.touch(message.channel.id, time.time())
+
+# Memory footprint
+# In lean mode discord.py's message cache is off unless gateway.max_messages asks for
+# one: nothing reads cached messages, transcripts page through the channel history and
+# activity is tracked by timestamp. The resident memory and cache sizes are reported
+# periodically so growth is visible.
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Peak, not current
+    return None
+
+def memory_report():
+    rss = rss_bytes()
+    return {
+        "rss_mb": round(rss / 2**20, 1) if rss else None,
+        "guilds": len(bot.guilds),
+        "members_cached": sum(len(g.members) for g in bot.guilds),
+        "users_cached": len(bot.users),
+        "messages_cached": len(bot.cached_messages),
+        "open_tickets": len(activity_tracker.last),
+    }
 
-    # Sr Admin+ only
-    allowed_roles = [
-        config["public_roles"]["sr_admin"],
-        config["public_roles"]["manager"],
-        config["public_roles"]["owner"]
+async def report_memory(interval):
+    await bot.wait_until_ready()
+    while True:
+        report = memory_report()
+        log("🧠 " + ", ".join(f"{k}={v}" for k, v in report.items()))
+        await asyncio.sleep(interval)
+
+# Metrics exporter
+# Gauges (ticket counts, queue lengths, caches, memory) are sampled when scraped, the
+# counters and histograms come from the Metrics registry.
+async def ticket_counts(p):
+    counts = await p.store.counts()
+    counts.update(unclaimed=len(p.claims.unclaimed), claimed=sum(p.claims.staff_load.values()))
+    return counts
+
+async def collect_gauges():
+    gauges = []
+    for gid, p in list(partitions.items()):
+        gauges += [("vector_tickets", {"guild": gid, "state": state}, n) for state, n in (await ticket_counts(p)).items()]
+        gauges.append(("vector_queue_length", {"guild": gid, "queue": "ticket_admission"}, len(p.admission.waiting)))
+    gauges += [
+        ("vector_queue_length", {"queue": "jobs"}, jobs.queue.qsize()),
+        ("vector_queue_length", {"queue": "log"}, log_dispatcher.pending),
+        ("vector_cached_messages", {"cache": "client"}, len(bot.cached_messages)),
+        ("vector_cached_members", {}, sum(len(g.members) for g in bot.guilds)),
+        ("vector_gateway_latency_seconds", {}, bot.latency if bot.is_ready() else 0),
     ]
+    rss = rss_bytes()
+    if rss:
+        gauges.append(("vector_resident_memory_bytes", {}, rss))
+    return gauges
+
+class MetricsExporter:
+    def __init__(self, host="127.0.0.1", port=9108):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            print(f"⚠️ Metrics exporter could not listen on {self.host}:{self.port}: {e}")
+            return
+        print(f"✅ Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle(self, request):
+        return web.Response(text=metrics.render(await collect_gauges()), content_type="text/plain")
+
+metrics_exporter = MetricsExporter(metrics_cfg.get("host", "127.0.0.1"), metrics_cfg.get("port", 9108))
+
+# Permissions
+# Who may do what is declared in config["permissions"] as lists of public_roles keys (or
+# raw role ids). Each list is compiled into a frozenset of role ids once per config load
+# and guild, and a member is resolved against their guild's set with one pass over their
+# roles, cached per distinct role set. Ticket access (claiming, sensitive search results)
+# goes through the same check with the ticket templates' role sets. Members of
+# unconfigured guilds have no permissions. python bench.py --permission-checks N
+# measures these checks.
+@functools.lru_cache(maxsize=4096)
+def resolve_permission(allowed, role_ids):
+    return not allowed.isdisjoint(role_ids)
+
+def member_role_ids(member):
+    # discord.py 2.x keeps a member's role ids in Member._roles, a sorted array, which is a
+    # canonical cache key without building and sorting Role objects like member.roles does
+    # (several times faster, see bench.py). This relies on discord.py 2.x internals, so any
+    # version without it falls back to the public member.roles.
+    role_ids = getattr(member, "_roles", None)
+    if role_ids is None:
+        return frozenset(r.id for r in member.roles)
+    return tuple(role_ids)
+
+def has_any_role(member, allowed):
+    # allowed is a frozenset of role ids
+    return resolve_permission(allowed, member_role_ids(member))
+
+def has_permission(member, perm):
+    gs = settings.guilds.get(member.guild.id)
+    return gs is not None and has_any_role(member, gs.permissions[perm])
+
+def require(perm):
+    # Slash command check, failures are answered by on_app_command_error
+    async def predicate(i: discord.Interaction):
+        return has_permission(i.user, perm)
+    return app_commands.check(predicate)
+
+@bot.tree.error
+async def on_app_command_error(i: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.CheckFailure):
+        return await i.response.send_message("You do not have permission to use this command.", ephemeral=True)
+    traceback.print_exception(error)
+
+# Config reload
+# config.json is polled for changes. A new version is parsed and validated off to the
+# side and only swapped in as a whole; an invalid file is reported and ignored. Guilds
+# added to the config get their commands and partition straight away, removed guilds
+# lose their commands (their files are left alone).
+reload_cfg = config.get("config_reload", {})
+RESTART_ONLY = ["token", "config_reload", "gateway", "storage", "jobs", "log_dispatch", "search", "transcripts", "claims", "bulk_rank", "retention", "inactivity", "metrics"]
+
+async def update_command_guilds(old_ids, new_ids):
+    # Register the guild commands in added guilds and clear them from removed ones
+    cmds = bot.tree.get_commands(guild=discord.Object(id=next(iter(old_ids))))
+    for gid in new_ids - old_ids:
+        guild = discord.Object(id=gid)
+        for cmd in cmds:
+            bot.tree.add_command(cmd, guild=guild)
+        await sync_commands(guild)
+    for gid in old_ids - new_ids:
+        guild = discord.Object(id=gid)
+        bot.tree.clear_commands(guild=guild)
+        try:
+            await bot.tree.sync(guild=guild)
+        except discord.HTTPException as e:
+            print(f"⚠️ Failed to clear commands from guild {gid}: {e}")
+        bot_state.get("command_tree_hashes", {}).pop(str(gid), None)
+    await save_state()
+
+class ConfigWatcher:
+    def __init__(self, path, interval=5):
+        self.path = path
+        self.interval = interval
+        self.mtime = os.stat(path).st_mtime_ns
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                mtime = (await asyncio.to_thread(os.stat, self.path)).st_mtime_ns
+            except OSError:
+                continue  # Mid-save or briefly missing, try again next tick
+            if mtime != self.mtime:
+                self.mtime = mtime
+                await self.reload()
+
+    async def reload(self):
+        global settings
+        try:
+            raw = await asyncio.to_thread(read_config, self.path)
+            new = build_settings(raw)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring invalid {self.path}: {e}")
+            log(f"⚠️ config.json was not reloaded: {e}")
+            return
+
+        # New guilds get their partition before any handler can see them configured
+        added = new.guilds.keys() - settings.guilds.keys()
+        for gid in added:
+            await open_partition(gid)
+
+        # The swap itself, everything derived was built above
+        old, settings = settings, new
+        resolve_permission.cache_clear()
+
+        stale = [key for key in RESTART_ONLY if raw.get(key) != config.get(key)]
+        if stale:
+            log(f"⚠️ Changes to {', '.join(stale)} in config.json need a restart to take effect.")
+        if new.guilds.keys() != old.guilds.keys():
+            await update_command_guilds(set(old.guilds), set(new.guilds))
+        for gid in added:
+            try:
+                await post_panel(gid)
+            except discord.HTTPException as e:
+                print(f"⚠️ Failed to post the ticket panel in guild {gid}: {e}")
+        if new.status != old.status:
+            await bot.change_presence(
+                status=discord.Status.dnd,
+                activity=discord.Activity(type=discord.ActivityType.watching, name=new.status)
+            )
+        log("🔄 Reloaded config.json.")
+
+config_watcher = ConfigWatcher(CONFIG_FILE, reload_cfg.get("interval", 5))
 
-    if not any(i.guild.get_role(rid) in i.user.roles for rid in allowed_roles):
-        return await i.response.send_message("No permission.", ephemeral=True)
+# Commands
 
+@bot.tree.command(name="deleteticket", guilds=GUILDS)
+@require("delete_ticket")
+@instrumented("deleteticket")
+async def deleteticket(i: discord.Interaction):
     # Must be archived
-    t = ticket_data.get(str(i.channel.id))
+    p, t = await get_ticket(i.channel)
     if not t or not t.get("archived"):
         return await i.response.send_message("This ticket is not archived.", ephemeral=True)
 
-    await log(f"❌ Archived ticket deleted: {i.channel.name} by {i.user}")
-    ticket_data.pop(str(i.channel.id))
-    save_data()
+    await i.response.defer(ephemeral=True, thinking=True)
+
+    async def run():
+        # Keep a transcript first, the channel is only deleted once it's safely on disk
+        path = await export_transcript(i.channel, t)
+        await i.channel.delete()
+        log(f"❌ Archived ticket deleted: {i.channel.name} by {i.user} (transcript: `{os.path.basename(path)}`)", i.guild)
+        p.store.delete(str(i.channel.id))
+
+    jobs.submit(Job("Deleting the ticket", run, key=str(i.channel.id), interaction=i))
+
+
+@bot.tree.command(name="ticketsearch", description="Searches ticket transcripts and details.", guilds=GUILDS)
+@require("view_tickets")
+@app_commands.describe(query="Words to look for, e.g. a player name or an order id.")
+@instrumented("ticketsearch")
+async def ticketsearch(i: discord.Interaction, query: str):
+    # Staff/Store tickets are only searchable by the roles that can see them
+    include_sensitive = can_handle(i.user, SENSITIVE_TICKETS[0])
+
+    index = partitions[i.guild.id].search
+    total, rows = await index.search(query, include_sensitive, 0)
+    view = SearchResultsView(index, query, include_sensitive, total)
+    await i.response.send_message(embed=search_embed(query, 0, total, rows), view=view, ephemeral=True)
+
+
+@bot.tree.command(name="queue", description="Shows unclaimed tickets and staff load.", guilds=GUILDS)
+@require("view_tickets")
+@instrumented("queue")
+async def queue(i: discord.Interaction):
+    # Only list tickets this staff member could pick up
+    claims = partitions[i.guild.id].claims
+    waiting = [(cid, t) for cid, t in claims.unclaimed.items() if can_handle(i.user, t["category"])]
+    lines = [f"<#{cid}> · {t['category']} · <t:{int(t.get('created_at') or 0)}:R>" for cid, t in waiting[:20]]
+    if len(waiting) > 20:
+        lines.append(f"…and {len(waiting) - 20} more")
+
+    embed = discord.Embed(
+        title=f"📋 Unclaimed tickets ({len(waiting)})",
+        description="\n".join(lines) or "Nothing waiting, nice work!",
+        color=0x00AAEE
+    )
+    busiest = claims.staff_load.most_common(10)
+    if busiest:
+        embed.add_field(name="Open tickets per staff member", value="\n".join(f"<@{sid}>: {n}" for sid, n in busiest), inline=False)
+    await i.response.send_message(embed=embed, ephemeral=True)
+
 
-    await i.channel.delete()
+@bot.tree.command(name="stats", description="Shows handler latency, rate limits and ticket counts.", guilds=GUILDS)
+@require("view_tickets")
+@instrumented("stats")
+async def stats(i: discord.Interaction):
+    if not metrics.enabled:
+        return await i.response.send_message("Metrics are disabled, set metrics.enabled in config.json.", ephemeral=True)
+
+    # 1. Busiest handlers first
+    handlers = sorted(metrics.summary("vector_handler_seconds"), key=lambda h: -h[1])
+    lines = [f"`{labels['handler']}` · {n}× · p50 {p50 * 1000:.0f} ms · p99 {p99 * 1000:.0f} ms"
+             for labels, n, p50, p99 in handlers[:15]]
+
+    # 2. Discord API, this guild's tickets and the queues
+    p = partitions[i.guild.id]
+    counts = await ticket_counts(p)
+    tickets = " · ".join(f"{state}: {counts[state]}" for state in ("open", "unclaimed", "claimed", "archived"))
+    queues = f"jobs: {jobs.queue.qsize()} · ticket_admission: {len(p.admission.waiting)} · log: {log_dispatcher.pending}"
+    rss = rss_bytes()
+
+    embed = discord.Embed(title="📊 Vector stats", color=0x00AAEE)
+    embed.add_field(name="Handlers", value="\n".join(lines) or "No calls yet.", inline=False)
+    embed.add_field(name="Discord API", value=(
+        f"{metrics.total('vector_http_requests_total'):.0f} requests · "
+        f"{metrics.total('vector_http_rate_limited_total'):.0f}× 429 · "
+        f"{metrics.total('vector_rate_limit_wait_seconds_total'):.1f} s waited"
+    ), inline=False)
+    embed.add_field(name="Tickets", value=tickets, inline=False)
+    embed.add_field(name="Queues", value=queues, inline=False)
+    embed.add_field(name="Memory", value=f"{rss / 2**20:.1f} MB" if rss else "unknown", inline=False)
+    await i.response.send_message(embed=embed, ephemeral=True)
 
 
-@bot.tree.command(name="ip", guild=GUILD)
+@bot.tree.command(name="ip", guilds=GUILDS)
+@instrumented("ip")
 async def ip(i: discord.Interaction):
     embed = discord.Embed(
         title="🎮 How to Join Vilyx",
@@ -262,22 +2289,10 @@ async def ip(i: discord.Interaction):
     )
     await i.response.send_message(embed=embed, ephemeral=True)
 
-@bot.tree.command(name="sendip", description="Sends the server IP.", guild=GUILD)
+@bot.tree.command(name="sendip", description="Sends the server IP.", guilds=GUILDS)
+@require("send_ip")
+@instrumented("sendip")
 async def sendip(i: discord.Interaction):
-    allowed_roles = [
-        config["public_roles"]["mod"],
-        config["public_roles"]["sr_mod"],
-        config["public_roles"]["admin"],
-        config["public_roles"]["sr_admin"],
-        config["public_roles"]["manager"],
-        config["public_roles"]["developer"],
-        config["public_roles"]["owner"]
-    ]
-
-    # Check if the user has at least one of the allowed roles
-    if not any(i.guild.get_role(rid) in i.user.roles for rid in allowed_roles):
-        return await i.response.send_message("You do not have permission to use this command.", ephemeral=True)
-
     # Create the embed
     embed = discord.Embed(
         title="🎮 How to Join Vilyx",
@@ -295,125 +2310,247 @@ async def sendip(i: discord.Interaction):
 
 
 # Promote / Demote syncing roles
-async def sync_roles(user, rank):
-    public_guild = bot.get_guild(config["public_guild_id"])
-    
-    # Remove old roles
-    for r in config["public_roles"].values():
-        if r and r != 0:  # <-- skip invalid roles
-            role = public_guild.get_role(r)
-            if role:
-                await user.remove_roles(role)
-    
-    # Add new roles
-    new_pub_role = public_guild.get_role(config["public_roles"].get(rank.lower()))
-    if new_pub_role: await user.add_roles(new_pub_role)
-
-
-
-@bot.tree.command(name="promote", guild=GUILD)
-async def promote(i: discord.Interaction, user: discord.Member):
-    # Check if user has Manager+ permission
-    allowed_roles = [
-        config["public_roles"]["manager"],
-        config["public_roles"]["owner"]
-    ]
-    if not any(i.guild.get_role(rid) in i.user.roles for rid in allowed_roles):
-        return await i.response.send_message("You do not have permission to use this command.", ephemeral=True)
+# Rank changes are planned as one add/remove diff against the member's current roles
+# and applied with a single member edit, instead of one API call per role. The edit
+# replaces the whole role list, so it must be planned from current roles. The member
+# that came with the interaction is current as of the command. It is only re-read when
+# the change waited behind another one for the same member, from the member cache if
+# the gateway keeps it up to date, otherwise from the API.
+async def current_member(member):
+    if bot.intents.members:
+        cached = member.guild.get_member(member.id)
+        if cached is not None:
+            return cached
+    return await member.guild.fetch_member(member.id)
+
+def plan_roles(member, add=(), remove=()):
+    # Returns the member's full target role list, or None if nothing would change.
+    # @everyone is implicit and never part of the list.
+    current = set(member.roles) - {member.guild.default_role}
+    target = (current - {r for r in remove if r}) | {r for r in add if r}
+    if target == current:
+        return None
+    return sorted(target)
+
+async def apply_roles(member, add=(), remove=(), reason=None):
+    # member must be current (see current_member)
+    roles = plan_roles(member, add, remove)
+    if roles is None:
+        return False
+    current = set(member.roles) - {member.guild.default_role}
+    added, removed = set(roles) - current, current - set(roles)
+    if len(added) + len(removed) == 1:
+        # A single role has its own endpoint, which leaves every other role alone
+        if added:
+            await member.add_roles(*added, reason=reason)
+        else:
+            await member.remove_roles(*removed, reason=reason)
+    else:
+        await member.edit(roles=roles, reason=reason)
+    return True
 
-    guild_roles = [i.guild.get_role(rid) for rid in ROLE_HIERARCHY]
+def plan_rank_change(guild, member, step):
+    # step is +1 to promote or -1 to demote. Returns (add, remove, new_role), or None
+    # if the member is already at the end of the rank hierarchy in that direction.
+    held = {r.id for r in member.roles}
 
     # Get the highest role the user currently has in the hierarchy
     current_index = -1
-    for idx, role in enumerate(guild_roles):
-        if role in user.roles:
+    gs = settings.guilds[guild.id]
+    hierarchy = gs.role_hierarchy
+    for idx, rid in enumerate(hierarchy):
+        if rid in held:
             current_index = idx
 
-    # If already at the top, cannot promote
-    if current_index >= len(guild_roles) - 1:
-        return await i.response.send_message(f"{user.display_name} is already at the highest rank.", ephemeral=True)
+    new_index = current_index + step
+    if new_index < 0 or new_index >= len(hierarchy):
+        return None
 
-    # Promote to next role
-    next_role = guild_roles[current_index + 1]
-    await user.add_roles(next_role)
+    current_role = guild.get_role(hierarchy[current_index]) if current_index >= 0 else None
+    new_role = guild.get_role(hierarchy[new_index])
 
     # Role references
-    member_role = i.guild.get_role(config["public_roles"]["member"])
-    mod_role = i.guild.get_role(config["public_roles"]["mod"])
-    staff_role = i.guild.get_role(config["public_roles"]["staff"])  # staff role in same guild
+    member_role = guild.get_role(gs.roles["member"])
+    mod_role = guild.get_role(gs.roles["mod"])
+    staff_role = guild.get_role(gs.roles["staff"])
+
+    add, remove = {new_role}, set()
+
+    # Remove the old rank, except Member is kept when going Member -> Mod
+    if current_role and not (current_role == member_role and new_role == mod_role):
+        remove.add(current_role)
+
+    # Staff role follows the Member <-> Mod boundary
+    if current_role == member_role and new_role == mod_role:
+        add.add(staff_role)
+    elif current_role == mod_role and new_role == member_role:
+        remove.add(staff_role)
+
+    return add, remove, new_role
+
+async def change_rank(guild, member, step, actor, stale=False):
+    # Moves a member one step along the rank hierarchy, returns the new rank role or None.
+    # stale: another change to this member ran since the member object was taken.
+    if stale:
+        member = await current_member(member)
+    change = plan_rank_change(guild, member, step)
+    if change is None:
+        return None
+    add, remove, new_role = change
+    verb = "Promoted" if step > 0 else "Demoted"
+    await apply_roles(member, add, remove, reason=f"{verb} to {new_role.name} by {actor}")
+    return new_role
+
+async def sync_roles(user, rank):
+    public_guild = bot.get_guild(settings.guild_id)
+    roles = settings.guilds[settings.guild_id].roles
+
+    # Drop every other public role and keep only the new rank
+    new_pub_role = public_guild.get_role(roles.get(rank.lower()))
+    old_roles = {public_guild.get_role(r) for r in roles.values() if r}  # skip invalid roles
+    user = await public_guild.fetch_member(user.id)
+    await apply_roles(user, add={new_pub_role}, remove=old_roles - {new_pub_role}, reason=f"Synced rank to {rank}")
+
+
+
+@bot.tree.command(name="promote", guilds=GUILDS)
+@require("manage_ranks")
+@instrumented("promote")
+async def promote(i: discord.Interaction, user: discord.Member):
+    await i.response.defer(ephemeral=True, thinking=True)
+
+    # Rank changes for the same member run in order
+    key = (i.guild.id, user.id)
+    stale = jobs.busy(key)
+
+    async def run():
+        next_role = await change_rank(i.guild, user, +1, i.user, stale)
 
-    # Remove previous role if applicable — except when going from Member -> Mod
-    if current_index >= 0:
-        current_role = guild_roles[current_index]
-        if not (current_role == member_role and next_role == mod_role):
-            await user.remove_roles(current_role)
+        # If already at the top, cannot promote
+        if next_role is None:
+            return f"{user.display_name} is already at the highest rank."
 
-    # If promoted from Member -> Mod, give Staff role
-    if member_role in user.roles and next_role == mod_role and staff_role:
-        await user.add_roles(staff_role)
+        log(f"📈 **{i.user}** promoted **{user.display_name}** to **{next_role.name}**.", i.guild)
+        return f"{user.display_name} has been promoted to {next_role.name}."
 
-    await i.response.send_message(f"{user.display_name} has been promoted to {next_role.name}.", ephemeral=True)
-    await log(f"📈 **{i.user}** promoted **{user.display_name}** to **{next_role.name}**.")
+    jobs.submit(Job("Promotion", run, key=key, interaction=i))
 
 
-@bot.tree.command(name="demote", guild=GUILD)
+@bot.tree.command(name="demote", guilds=GUILDS)
+@require("manage_ranks")
+@instrumented("demote")
 async def demote(i: discord.Interaction, user: discord.Member):
-    # Check if user has Manager+ permission
-    allowed_roles = [
-        config["public_roles"]["manager"],
-        config["public_roles"]["owner"]
-    ]
-    if not any(i.guild.get_role(rid) in i.user.roles for rid in allowed_roles):
-        return await i.response.send_message("You do not have permission to use this command.", ephemeral=True)
+    await i.response.defer(ephemeral=True, thinking=True)
 
-    guild_roles = [i.guild.get_role(rid) for rid in ROLE_HIERARCHY]
+    # Rank changes for the same member run in order
+    key = (i.guild.id, user.id)
+    stale = jobs.busy(key)
 
-    # Get the highest role the user currently has in the hierarchy
-    current_index = -1
-    for idx, role in enumerate(guild_roles):
-        if role in user.roles:
-            current_index = idx
+    async def run():
+        prev_role = await change_rank(i.guild, user, -1, i.user, stale)
 
-    # If already at the lowest, cannot demote
-    if current_index <= 0:
-        return await i.response.send_message(f"{user.display_name} is already at the lowest rank.", ephemeral=True)
+        # If already at the lowest, cannot demote
+        if prev_role is None:
+            return f"{user.display_name} is already at the lowest rank."
 
-    # Demote to previous role
-    prev_role = guild_roles[current_index - 1]
-    await user.add_roles(prev_role)
+        log(f"📉 **{i.user}** demoted **{user.display_name}** to **{prev_role.name}**.", i.guild)
+        return f"{user.display_name} has been demoted to {prev_role.name}."
 
-    # Role references
-    member_role = i.guild.get_role(config["public_roles"]["member"])
-    mod_role = i.guild.get_role(config["public_roles"]["mod"])
-    staff_role = i.guild.get_role(config["public_roles"]["staff"])
+    jobs.submit(Job("Demotion", run, key=key, interaction=i))
+
+
+# Bulk rank changes run through a semaphore so a large reshuffle stays inside the
+# member-edit rate limit instead of queueing dozens of requests at once
+BULK_RANK_CONCURRENCY = config.get("bulk_rank", {}).get("concurrency", 4)
+BULK_RANK_PROGRESS_EVERY = config.get("bulk_rank", {}).get("progress_every", 25)
+
+@bot.tree.command(name="bulkrank", description="Promotes or demotes many members at once.", guilds=GUILDS)
+@require("manage_ranks")
+@app_commands.describe(
+    action="Whether to promote or demote the members.",
+    members="Members to change, as mentions or IDs separated by spaces. (Optional)",
+    role="Change everyone currently holding this role. (Optional)"
+)
+@app_commands.choices(action=[
+    app_commands.Choice(name="Promote", value=1),
+    app_commands.Choice(name="Demote", value=-1),
+])
+@instrumented("bulkrank")
+async def bulkrank(i: discord.Interaction, action: app_commands.Choice[int], members: str = None, role: discord.Role = None):
+    # Resolving members may need API calls, so acknowledge first
+    await i.response.defer(ephemeral=True, thinking=True)
+
+    # 1. Collect targets, deduplicated by id
+    targets = {}
+    if role and not bot.intents.members:
+        return await i.followup.send("Changing everyone with a role needs `bulk_rank.by_role` enabled in config.json.", ephemeral=True)
+    if role:
+        if not i.guild.chunked:
+            await i.guild.chunk()  # Member list not loaded yet (e.g. right after startup)
+        for m in role.members:
+            targets[m.id] = m
+    for mid in re.findall(r"\d{15,20}", members or ""):
+        mid = int(mid)
+        if mid in targets:
+            continue
+        # Rank changes are planned from these members, so the cache only counts when the gateway keeps it current
+        m = i.guild.get_member(mid) if bot.intents.members else None
+        if m is None:
+            try:
+                m = await i.guild.fetch_member(mid)
+            except discord.NotFound:
+                continue
+        targets[m.id] = m
 
-    # Remove old role
-    current_role = guild_roles[current_index]
-    await user.remove_roles(current_role)
+    if not targets:
+        return await i.followup.send("No members matched.", ephemeral=True)
 
-    # If demoted from Mod -> Member, remove Staff role
-    if current_role == mod_role and prev_role == member_role and staff_role:
-        await user.remove_roles(staff_role)
+    verb = "promote" if action.value > 0 else "demote"
+    total = len(targets)
+    log(f"🔁 **{i.user}** started a bulk {verb} of {total} members.", i.guild)
 
-    await i.response.send_message(f"{user.display_name} has been demoted to {prev_role.name}.", ephemeral=True)
-    await log(f"📉 **{i.user}** demoted **{user.display_name}** to **{prev_role.name}**.")
+    # 2. Run the changes with bounded concurrency
+    limiter = asyncio.Semaphore(BULK_RANK_CONCURRENCY)
+    changed, skipped, failed = [], [], []
 
-@bot.tree.command(name="sendembed", description="Sends a custom embed into the channel.", guild=GUILD)
+    async def run(member):
+        # In turn with /promote and /demote jobs for the same member
+        async with limiter:
+            try:
+                async with jobs.turn((i.guild.id, member.id)) as waited:
+                    new_role = await change_rank(i.guild, member, action.value, i.user, waited)
+            except discord.HTTPException as e:
+                failed.append(f"{member.display_name} ({e.status})")
+            except Exception as e:  # One bad member must not abort the whole batch
+                failed.append(f"{member.display_name} ({type(e).__name__})")
+            else:
+                if new_role is None:
+                    skipped.append(member.display_name)
+                else:
+                    changed.append(f"{member.display_name} → {new_role.name}")
+
+            done = len(changed) + len(skipped) + len(failed)
+            if done % BULK_RANK_PROGRESS_EVERY == 0 and done < total:
+                log(f"🔁 Bulk {verb} progress: {done}/{total}", i.guild)
+
+    await asyncio.gather(*(run(m) for m in targets.values()))
+
+    # 3. One summary instead of a line per member
+    summary = f"Bulk {verb}: {len(changed)} changed, {len(skipped)} already at the {'highest' if action.value > 0 else 'lowest'} rank, {len(failed)} failed."
+    details = "\n".join(changed + [f"⚠️ {f}" for f in failed])
+    log(f"{'📈' if action.value > 0 else '📉'} **{i.user}** {summary}\n{details}".strip(), i.guild)
+    await i.followup.send(f"{summary}\n{details}"[:MAX_MESSAGE_LEN], ephemeral=True)
+
+
+@bot.tree.command(name="sendembed", description="Sends a custom embed into the channel.", guilds=GUILDS)
+@require("send_embed")
 @app_commands.describe(
     title="The title of the embed.",
     message="The main message/description of the embed. Use '||' for a new line.",
     hex_color="The embed color in hex format (e.g., FF0000 for red). (Optional)"
 )
+@instrumented("sendembed")
 async def sendembed(i: discord.Interaction, title: str, message: str, hex_color: str = None):
-    # Check if user has Owner or Manager permission
-    allowed_roles = [
-        config["public_roles"]["manager"],
-        config["public_roles"]["owner"]
-    ]
-    
-    if not any(i.guild.get_role(rid) in i.user.roles for rid in allowed_roles):
-        return await i.response.send_message("You do not have permission to use this command.", ephemeral=True)
-
     # 1. Process Message and Color
     processed_message = message.replace("||", "\n")
     
@@ -462,39 +2599,50 @@ async def sendembed(i: discord.Interaction, title: str, message: str, hex_color:
 
 
 
-@bot.event
-async def on_ready():
-    # Register persistent views 
-    if not hasattr(bot, "persistent_views_added"):
-        bot.add_view(TicketButtons())
-        bot.persistent_views_added = True
+def panel_embed():
+    return discord.Embed(
+        title="🎫 Vilyx Tickets",
+        description="Select a category below to open a ticket:",
+        color=0x00AAEE
+    )
 
-    GUILD_ID = config["public_guild_id"]  # Guild to sync slash commands to
-    guild = discord.Object(id=GUILD_ID)
+async def post_panel(guild_id):
+    panel_ch = bot.get_channel(settings.guilds[guild_id].channels["ticket_panel"])
+    if not panel_ch:
+        return
+
+    # Edit the panel we posted last time in place, only post a new one if it's gone
+    state = guild_state(guild_id)
+    panel_id = state.get("panel_message_id")
+    if panel_id:
+        try:
+            await panel_ch.get_partial_message(panel_id).edit(embed=panel_embed(), view=TicketPanel())
+            return
+        except discord.NotFound:
+            pass
+    else:
+        await panel_ch.purge()  # First run, clear out panels posted before the id was tracked
 
-    try:
-        synced = await bot.tree.sync(guild=guild)
-        print(f"✅ Synced {len(synced)} slash commands to guild {GUILD_ID}")
-    except Exception as e:
-        print(f"⚠️ Failed to sync commands to guild {GUILD_ID}: {e}")
+    msg = await panel_ch.send(embed=panel_embed(), view=TicketPanel())
+    state["panel_message_id"] = msg.id
+    await save_state()
 
-    await bot.change_presence(
-        status=discord.Status.dnd,
-        activity=discord.Activity(type=discord.ActivityType.watching, name=status_text)
-    )
+@bot.event
+async def on_ready():
+    # on_ready fires again on every gateway reconnect, only do the startup work once
+    if getattr(bot, "panel_posted", False):
+        return
+    bot.panel_posted = True
 
-    # Send ticket panel
-    panel_ch = bot.get_channel(config["channels"]["ticket_panel"])
-    if panel_ch:
-        await panel_ch.purge()
-        embed = discord.Embed(
-            title="🎫 Vilyx Tickets",
-            description="Select a category below to open a ticket:",
-            color=0x00AAEE
-        )
-        view = TicketPanel()
-        await panel_ch.send(embed=embed, view=view)
+    for gid in settings.guilds:
+        try:
+            await post_panel(gid)
+        except discord.HTTPException as e:
+            print(f"⚠️ Failed to post the ticket panel in guild {gid}: {e}")
 
     print(f"Bot online as {bot.user}")
 
-bot.run(TOKEN)
+if __name__ == "__main__":  # bench.py imports the module without connecting
+    bot.run(TOKEN)
+    for p in partitions.values():
+        p.close()
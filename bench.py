@@ -0,0 +1,635 @@
+"""Offline load test for Vector.
+
+Runs the real ticket and rank handlers from Vector.py against an in-process stand-in
+for Discord (guild, members, roles, channels, interactions) with simulated API latency
+and rate limits, and reports throughput, handler latency, event-loop stalls and API
+calls per operation for each scenario.
+
+    python bench.py                          # 1,000 simultaneous ticket opens and the rest
+    python bench.py --tickets 200 --latency 0.08
+    python bench.py --save baseline.json
+    python bench.py --compare baseline.json  # exits 1 if a scenario got slower
+
+Nothing connects to Discord. The bot runs in a scratch directory with a generated
+config.json, so the real data/state/search files are never touched.
+"""
+import argparse, asyncio, importlib, itertools, json, os, random, shutil, sys, tempfile, time
+from collections import Counter, deque
+from types import SimpleNamespace
+
+import discord
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Buckets the fake API enforces as (requests, per seconds). Roughly what Discord applies,
+# override with --limit "ROUTE=N/SECONDS" (or ROUTE=off).
+GLOBAL_LIMIT = (50, 1.0)  # per bot, interaction callbacks and followups are exempt
+DEFAULT_LIMITS = {
+    "POST /channels/{id}/messages": (5, 5.0),  # per channel
+    "PATCH /channels/{id}": (2, 600.0),  # renames, per channel
+}
+INTERACTION_ROUTES = {"POST /interactions/{id}/callback", "PATCH /webhooks/{id}/messages/@original",
+                      "POST /webhooks/{id}"}
+
+ids = itertools.count(1_100_000_000_000_000_000)
+
+# Fake Discord
+
+class FakeAPI:
+    def __init__(self, latency=0.05, jitter=0.015, limits=None, global_limit=GLOBAL_LIMIT):
+        self.latency = latency
+        self.jitter = jitter
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.global_limit = global_limit
+        self.calls = Counter()  # route -> requests
+        self.rate_limited = 0  # simulated 429s
+        self.waited = 0.0  # seconds spent waiting them out
+        self._windows = {}  # bucket -> send times within the window
+
+    async def _take(self, bucket, limit):
+        count, per = limit
+        window = self._windows.setdefault(bucket, deque())
+        loop = asyncio.get_running_loop()
+        limited = False
+        while True:
+            now = loop.time()
+            while window and window[0] <= now - per:
+                window.popleft()
+            if len(window) < count:
+                window.append(now)
+                return
+            # A 429: discord.py sleeps for retry_after and sends the request again.
+            # Requests racing for the same slot keep waiting, but count as one 429 each.
+            retry_after = window[0] + per - now
+            if not limited:
+                limited = True
+                self.rate_limited += 1
+            self.waited += retry_after
+            await asyncio.sleep(retry_after)
+
+    async def request(self, route, major=None):
+        self.calls[route] += 1
+        if self.global_limit and route not in INTERACTION_ROUTES:
+            await self._take("global", self.global_limit)
+        if self.limits.get(route):
+            await self._take((route, major), self.limits[route])
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def snapshot(self):
+        return sum(self.calls.values()), self.rate_limited, self.waited
+
+class FakeRole:
+    def __init__(self, guild, name, position, rid=None):
+        self.guild = guild
+        self.id = rid or next(ids)
+        self.name = name
+        self.position = position
+
+    @property
+    def mention(self):
+        return f"<@&{self.id}>"
+
+    @property
+    def members(self):
+        return [m for m in self.guild.members.values() if self.id in m._roles]
+
+    def __lt__(self, other):
+        return (self.position, self.id) < (other.position, other.id)
+
+    def __str__(self):
+        return self.name
+
+class FakeMember:
+    bot = False
+
+    def __init__(self, guild, name, role_ids=()):
+        self.guild = guild
+        self.id = next(ids)
+        self.name = self.display_name = name
+        self._roles = sorted(role_ids)
+
+    @property
+    def roles(self):
+        return sorted([self.guild.default_role] + [self.guild.roles[r] for r in self._roles])
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    async def edit(self, *, roles=None, reason=None):
+        await self.guild.api.request("PATCH /guilds/{id}/members/{id}", self.guild.id)
+        if roles is not None:
+            self._roles = sorted(r.id for r in roles if r is not self.guild.default_role)
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.guild.api.request("PUT /guilds/{id}/members/{id}/roles/{id}", self.guild.id)
+            self._roles = sorted(set(self._roles) | {role.id})
+
+    async def remove_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.guild.api.request("DELETE /guilds/{id}/members/{id}/roles/{id}", self.guild.id)
+            self._roles = sorted(set(self._roles) - {role.id})
+
+    def __str__(self):
+        return self.name
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None, view=None):
+        self.id = next(ids)
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.view = view
+
+class FakePartialMessage:
+    def __init__(self, channel, mid):
+        self.channel = channel
+        self.id = mid
+
+    async def edit(self, **fields):
+        await self.channel.guild.api.request("PATCH /channels/{id}/messages/{id}", self.channel.id)
+
+class FakeCategory:
+    def __init__(self, guild, name, position, overwrites=None):
+        self.guild = guild
+        self.id = next(ids)
+        self.name = name
+        self.position = position
+        self.overwrites = overwrites or {}
+        self.channels = []
+
+class FakeTextChannel:
+    def __init__(self, guild, name, category=None, overwrites=None, topic=None):
+        self.guild = guild
+        self.id = next(ids)
+        self.name = name
+        self.category = category
+        self.overwrites = overwrites or {}
+        self.topic = topic
+        self.messages = []
+        if category:
+            category.channels.append(self)
+
+    @property
+    def mention(self):
+        return f"<#{self.id}>"
+
+    async def send(self, content=None, *, embed=None, view=None, delete_after=None):
+        await self.guild.api.request("POST /channels/{id}/messages", self.id)
+        msg = FakeMessage(self, content, embed, view)
+        self.messages.append(msg)
+        return msg
+
+    async def edit(self, *, name=None, category=None, sync_permissions=False, reason=None):
+        await self.guild.api.request("PATCH /channels/{id}", self.id)
+        if name is not None:
+            self.name = name
+        if category is not None and category is not self.category:
+            if self.category:
+                self.category.channels.remove(self)
+            category.channels.append(self)
+            self.category = category
+            if sync_permissions:
+                self.overwrites = dict(category.overwrites)
+
+    async def delete(self, reason=None):
+        await self.guild.api.request("DELETE /channels/{id}", self.id)
+        if self.category:
+            self.category.channels.remove(self)
+        self.guild.channels.pop(self.id, None)
+
+    def get_partial_message(self, mid):
+        return FakePartialMessage(self, mid)
+
+class FakeGuild:
+    def __init__(self, api):
+        self.api = api
+        self.id = next(ids)
+        self.roles = {}
+        self.members = {}
+        self.channels = {}
+        self.default_role = FakeRole(self, "@everyone", 0, rid=self.id)
+
+    def add_role(self, name, position):
+        role = FakeRole(self, name, position)
+        self.roles[role.id] = role
+        return role
+
+    def add_member(self, name, roles=()):
+        member = FakeMember(self, name, [r.id for r in roles])
+        self.members[member.id] = member
+        return member
+
+    def add_category(self, name):
+        cat = FakeCategory(self, name, len(self.channels))
+        self.channels[cat.id] = cat
+        return cat
+
+    def add_text_channel(self, name, category=None):
+        ch = FakeTextChannel(self, name, category)
+        self.channels[ch.id] = ch
+        return ch
+
+    def get_role(self, rid):
+        return self.default_role if rid == self.id else self.roles.get(rid)
+
+    def get_member(self, mid):
+        return self.members.get(mid)
+
+    async def fetch_member(self, mid):
+        await self.api.request("GET /guilds/{id}/members/{id}", self.id)
+        if mid not in self.members:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return self.members[mid]
+
+    def get_channel(self, cid):
+        return self.channels.get(cid)
+
+    async def create_text_channel(self, name, *, overwrites=None, topic=None, category=None, reason=None):
+        await self.api.request("POST /guilds/{id}/channels", self.id)
+        ch = FakeTextChannel(self, name, category, overwrites, topic)
+        self.channels[ch.id] = ch
+        return ch
+
+    async def create_category(self, name, *, overwrites=None, position=None, reason=None):
+        await self.api.request("POST /guilds/{id}/channels", self.id)
+        cat = FakeCategory(self, name, position or 0, overwrites)
+        self.channels[cat.id] = cat
+        return cat
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+        self._done = True
+        await self._interaction.api.request("POST /interactions/{id}/callback", self._interaction.id)
+        return SimpleNamespace(message_id=next(ids))
+
+    async def send_message(self, content=None, *, embed=None, view=None, ephemeral=False):
+        return await self._respond()
+
+    async def defer(self, *, ephemeral=False, thinking=False):
+        return await self._respond()
+
+    async def edit_message(self, *, content=None, view=None):
+        return await self._respond()
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, *, embed=None, ephemeral=False):
+        await self._interaction.api.request("POST /webhooks/{id}", self._interaction.id)
+        self._interaction.finished.set()
+
+class FakeInteraction:
+    def __init__(self, api, user, channel):
+        self.api = api
+        self.id = next(ids)
+        self.user = user
+        self.guild = user.guild
+        self.channel = channel
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.finished = asyncio.Event()  # set by the final edit/followup
+
+    async def edit_original_response(self, *, content=None, embed=None, view=None):
+        await self.api.request("PATCH /webhooks/{id}/messages/@original", self.id)
+        self.finished.set()
+
+# Vector, loaded against the fake guild
+
+def bench_config(guild, roles, channels, categories, args):
+    with open(os.path.join(ROOT, "config.json")) as f:
+        cfg = json.load(f)
+    cfg["public_guild_id"] = guild.id
+    cfg["public_roles"] = {key: role.id for key, role in roles.items()}
+    cfg["channels"] = {key: ch.id for key, ch in channels.items()}
+    cfg["ticket_categories"] = {key: cat.id for key, cat in categories.items()}
+    cfg.setdefault("tickets", {})["create_interval"] = args.create_interval
+    cfg["storage"] = dict(cfg.get("storage", {}), backend=args.backend)
+    for section in ("retention", "inactivity", "config_reload", "metrics"):
+        cfg[section] = dict(cfg.get(section, {}), enabled=False)
+    return cfg
+
+def build_world(api, args):
+    guild = FakeGuild(api)
+    ranks = ["member", "mod", "sr_mod", "admin", "sr_admin", "manager", "owner"]
+    roles = {key: guild.add_role(key, pos) for pos, key in enumerate(ranks + ["staff", "developer"], 1)}
+    categories = {key: guild.add_category(key) for key in ("general_tickets", "staff_store_tickets", "archived")}
+    channels = {key: guild.add_text_channel(key) for key in ("ticket_panel", "logs")}
+    channels["archived"] = categories["archived"]
+
+    manager = guild.add_member("manager", [roles["manager"], roles["staff"]])
+    mod = guild.add_member("mod", [roles["mod"], roles["staff"]])
+    players = [guild.add_member(f"player{n}", [roles["member"]]) for n in range(max(args.tickets, args.members))]
+    world = SimpleNamespace(guild=guild, roles=roles, channels=channels, categories=categories,
+                            manager=manager, mod=mod, players=players, tickets=[])
+    return world, bench_config(guild, roles, channels, categories, args)
+
+def load_vector(cfg, workdir):
+    with open(os.path.join(workdir, "config.json"), "w") as f:
+        json.dump(cfg, f)
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    return importlib.import_module("Vector")
+
+# Measurement
+
+class LoopMonitor:
+    # Wakes every interval and records how late it was, anything past a millisecond is a stall
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stalled = 0.0
+        self.worst = 0.0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            if lag > 0.001:
+                self.stalled += lag
+                self.worst = max(self.worst, lag)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+async def run_scenario(name, api, ops):
+    # ops: coroutine functions returning (ack latency, done latency) for one operation
+    calls, limited, waited = api.snapshot()
+    with LoopMonitor() as monitor:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(op() for op in ops))
+        wall = time.perf_counter() - start
+    calls2, limited2, waited2 = api.snapshot()
+    acks = [r[0] for r in results]
+    dones = [r[1] for r in results]
+    return {
+        "scenario": name,
+        "ops": len(ops),
+        "wall_s": round(wall, 3),
+        "ops_per_s": round(len(ops) / wall, 1) if wall else 0.0,
+        "ack_p50_ms": round(percentile(acks, 0.5) * 1000, 1),
+        "ack_p99_ms": round(percentile(acks, 0.99) * 1000, 1),
+        "done_p50_ms": round(percentile(dones, 0.5) * 1000, 1),
+        "done_p99_ms": round(percentile(dones, 0.99) * 1000, 1),
+        "calls_per_op": round((calls2 - calls) / len(ops), 2) if ops else 0.0,
+        "rate_limited": limited2 - limited,
+        "rate_limit_wait_s": round(waited2 - waited, 2),
+        "stall_total_ms": round(monitor.stalled * 1000, 1),
+        "stall_max_ms": round(monitor.worst * 1000, 1),
+    }
+
+async def timed(handler, interaction, wait_done=True):
+    start = time.perf_counter()
+    await handler
+    ack = time.perf_counter() - start
+    if wait_done:
+        await interaction.finished.wait()
+    return ack, time.perf_counter() - start
+
+def button(view, custom_id):
+    return next(item for item in view.children if getattr(item, "custom_id", None) == custom_id)
+
+async def check(command, interaction):
+    # The command's app_commands checks, the same ones the tree runs before the callback
+    for predicate in command.checks:
+        if not await discord.utils.maybe_coroutine(predicate, interaction):
+            raise RuntimeError(f"{interaction.user} failed the checks for /{command.name}")
+
+# Scenarios
+
+def open_tickets(V, api, world, n):
+    panel = V.TicketPanel()
+    click = button(panel, "panel_general_support")
+    panel_channel = world.channels["ticket_panel"]
+
+    def op(player):
+        async def run():
+            i = FakeInteraction(api, player, panel_channel)
+            return await timed(click.callback(i), i)
+        return run
+
+    return [op(p) for p in world.players[:n]]
+
+def close_tickets(V, api, world):
+    view = V.TicketButtons()
+    close = button(view, "ticket_close")
+
+    def op(channel):
+        async def run():
+            i = FakeInteraction(api, world.mod, channel)
+            return await timed(close.callback(i), i, wait_done=False)
+        return run
+
+    return [op(ch) for ch in world.tickets]
+
+def archive_tickets(V, api, world):
+    # What CloseScheduler does once the countdowns run out: one keyed job per ticket
+    def op(channel):
+        async def run():
+            done = asyncio.Event()
+
+            async def job():
+                try:
+                    await V.archive_ticket(channel, world.mod)
+                finally:
+                    done.set()
+
+            start = time.perf_counter()
+            V.jobs.submit(V.Job(f"Archiving {channel.name}", job, key=str(channel.id)))
+            ack = time.perf_counter() - start
+            await done.wait()
+            return ack, time.perf_counter() - start
+        return run
+
+    return [op(ch) for ch in world.tickets]
+
+def change_ranks(V, api, world, command, n):
+    def op(player):
+        async def run():
+            i = FakeInteraction(api, world.manager, world.channels["logs"])
+            await check(command, i)
+            return await timed(command.callback(i, player), i)
+        return run
+
+    return [op(p) for p in world.players[:n]]
+
+def send_embeds(V, api, world, n):
+    # Spread over the ticket channels, a single channel would just measure its send bucket
+    channels = world.tickets or [world.channels["logs"]]
+
+    def op(k):
+        async def run():
+            i = FakeInteraction(api, world.manager, channels[k % len(channels)])
+            await check(V.sendembed, i)
+            return await timed(V.sendembed.callback(i, f"Notice {k}", "Line one||Line two", "FF0000"), i)
+        return run
+
+    return [op(k) for k in range(n)]
+
+async def run_all(V, api, world, args):
+    await V.open_partition(world.guild.id)
+    V.jobs.start()
+    results = [await run_scenario("open_tickets", api, open_tickets(V, api, world, args.tickets))]
+    world.tickets = [ch for ch in world.guild.channels.values()
+                     if isinstance(ch, FakeTextChannel) and ch.category is world.categories["general_tickets"]]
+    results.append(await run_scenario("close_button", api, close_tickets(V, api, world)))
+    results.append(await run_scenario("archive_ticket", api, archive_tickets(V, api, world)))
+    results.append(await run_scenario("promote", api, change_ranks(V, api, world, V.promote, args.members)))
+    results.append(await run_scenario("demote", api, change_ranks(V, api, world, V.demote, args.members)))
+    results.append(await run_scenario("sendembed", api, send_embeds(V, api, world, args.embeds)))
+    return results
+
+# Permission checks
+# A synchronous micro-benchmark of the role checks every command, button and search runs:
+# the role scan they used to do (get_role() plus a membership test per role), the cached
+# check keyed on the public member.roles (Vector's fallback), and Vector's own checks.
+
+def permission_checks(V, world, n):
+    guild = world.guild
+    filler = [guild.add_role(f"filler{k}", 20 + k) for k in range(12)]
+    allowed = guild.add_member("allowed", [world.roles["manager"], world.roles["staff"]] + filler)
+    denied = guild.add_member("denied", [world.roles["member"]] + filler)
+    manage_ranks = V.settings.guilds[guild.id].permissions["manage_ranks"]
+
+    def role_scan(member):
+        return any(guild.get_role(rid) in member.roles for rid in manage_ranks)
+
+    def public_roles(member):
+        return V.resolve_permission(manage_ranks, frozenset(r.id for r in member.roles))
+
+    checks = [
+        ("role scan", role_scan),
+        ("member.roles", public_roles),
+        ("has_permission", lambda m: V.has_permission(m, "manage_ranks")),
+        ("can_handle", lambda m: V.can_handle(m, V.SENSITIVE_TICKETS[0])),
+    ]
+    rows = []
+    for name, check in checks:
+        row = {"check": name}
+        for label, member in (("allowed", allowed), ("denied", denied)):
+            check(member)  # warm the cache
+            start = time.perf_counter()
+            for _ in range(n):
+                check(member)
+            row[f"{label}_us"] = round((time.perf_counter() - start) / n * 1e6, 2)
+        rows.append(row)
+    return rows, len(allowed.roles)
+
+# Reporting
+
+COLUMNS = [
+    ("scenario", "scenario", "{:<15}"), ("ops", "ops", "{:>6}"), ("wall_s", "wall s", "{:>8}"),
+    ("ops_per_s", "ops/s", "{:>8}"), ("ack_p50_ms", "ack p50", "{:>8}"), ("ack_p99_ms", "ack p99", "{:>8}"),
+    ("done_p50_ms", "done p50", "{:>9}"), ("done_p99_ms", "done p99", "{:>9}"), ("calls_per_op", "calls/op", "{:>9}"),
+    ("rate_limited", "429s", "{:>6}"), ("rate_limit_wait_s", "429 wait", "{:>9}"),
+    ("stall_total_ms", "stall", "{:>8}"), ("stall_max_ms", "max stall", "{:>10}"),
+]
+
+def print_report(results):
+    print(" ".join(fmt.format(title) for _, title, fmt in COLUMNS))
+    for r in results:
+        print(" ".join(fmt.format(r[key]) for key, _, fmt in COLUMNS))
+    print("Latencies and stalls in ms. ack = handler returned, done = final response or job finished.")
+
+def print_permission_checks(rows, role_count):
+    print(f"\n{'check':<15} {'allowed':>8} {'denied':>8}")
+    for r in rows:
+        print(f"{r['check']:<15} {r['allowed_us']:>8} {r['denied_us']:>8}")
+    print(f"Microseconds per check, members holding {role_count} roles.")
+
+def compare(results, baseline, tolerance):
+    # A scenario regresses when its p99 completion latency or API calls per op grow past the tolerance
+    before = {r["scenario"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        old = before.get(r["scenario"])
+        if not old:
+            continue
+        for key in ("done_p99_ms", "calls_per_op"):
+            if old[key] and r[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{r['scenario']}: {key} {old[key]} -> {r[key]}")
+    return regressions
+
+def parse_limit(text):
+    route, _, spec = text.rpartition("=")
+    if spec == "off":
+        return route, None
+    count, per = spec.split("/")
+    return route, (int(count), float(per))
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test Vector against a simulated Discord API.")
+    parser.add_argument("--tickets", type=int, default=1000, help="simultaneous ticket opens (then closed and archived)")
+    parser.add_argument("--members", type=int, default=200, help="members promoted and then demoted")
+    parser.add_argument("--embeds", type=int, default=200, help="/sendembed invocations")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.015, help="standard deviation of the API latency")
+    parser.add_argument("--limit", action="append", default=[], metavar="ROUTE=N/SECONDS",
+                        help='override a route bucket, e.g. "POST /guilds/{id}/channels=10/10" or ROUTE=off')
+    parser.add_argument("--global-limit", type=float, default=GLOBAL_LIMIT[0], help="global requests per second, 0 disables")
+    parser.add_argument("--create-interval", type=float, default=0.0,
+                        help="tickets.create_interval for the run (the bot's own pacing between channel creations)")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json", help="ticket store backend")
+    parser.add_argument("--permission-checks", type=int, default=20000, metavar="N",
+                        help="iterations of the permission check micro-benchmark, 0 skips it")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare against saved results, exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression for --compare")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    limits = dict(DEFAULT_LIMITS, **dict(parse_limit(l) for l in args.limit))
+    api = FakeAPI(args.latency, args.jitter, limits, (args.global_limit, 1.0) if args.global_limit else None)
+    world, cfg = build_world(api, args)
+
+    workdir = tempfile.mkdtemp(prefix="vector-bench-")
+    try:
+        V = load_vector(cfg, workdir)
+        results = asyncio.run(run_all(V, api, world, args))
+        checks = permission_checks(V, world, args.permission_checks) if args.permission_checks else None
+        for p in V.partitions.values():
+            p.close()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    if checks:
+        print_permission_checks(*checks)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"⚠️ Regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import sys
+
+import pytest
+
+@pytest.fixture(scope="session", autouse=True)
+def shared_world():
+    # Torn down while still in the scratch directory, pytest changes back before sessionfinish
+    yield
+    support = sys.modules.get("support")
+    if support is not None:
+        support.teardown()
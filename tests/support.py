@@ -0,0 +1,46 @@
+"""The fake guild from bench.py, shared by every test module.
+
+Vector is configured when it is first imported and its job queue lives on one event
+loop, so the modules share one import, one world and one loop (torn down in conftest.py).
+"""
+import argparse, asyncio, os, shutil, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import bench
+
+def setup_world():
+    api = bench.FakeAPI(latency=0.0, jitter=0.0, global_limit=None)
+    args = argparse.Namespace(tickets=0, members=0, create_interval=0.0, backend="json")
+    world, cfg = bench.build_world(api, args)
+    cfg["inactivity"] = {"enabled": True, "min_notice_minutes": 60,
+                         "categories": {"default": {"warn_after_hours": 48, "close_after_hours": 72}}}
+    # Stays in the scratch directory (the ticket files are relative to it) until teardown
+    workdir = tempfile.mkdtemp(prefix="vector-test-")
+    V = bench.load_vector(cfg, workdir)
+    V.bot.get_channel = world.guild.get_channel
+    return V, world, workdir
+
+V, world, workdir = setup_world()
+
+loop = asyncio.new_event_loop()
+
+def run(coro):
+    async def main():
+        if world.guild.id not in V.partitions:
+            await V.open_partition(world.guild.id)
+        V.jobs.start()
+        return await coro
+    return loop.run_until_complete(main())
+
+def teardown():
+    async def stop():
+        for task in V.jobs._tasks:
+            task.cancel()
+        await asyncio.gather(*V.jobs._tasks, return_exceptions=True)
+    loop.run_until_complete(stop())
+    loop.close()
+    for p in V.partitions.values():
+        p.close()
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
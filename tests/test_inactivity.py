@@ -0,0 +1,68 @@
+"""Inactivity tracking against the fake guild from bench.py.
+
+    python -m pytest -q tests
+"""
+import asyncio, time
+
+from support import V, world, run
+
+HOUR = 3600
+
+def add_ticket(p, name, **fields):
+    ch = world.guild.add_text_channel(name, world.categories["general_tickets"])
+    p.store.put(str(ch.id), {"user": world.players[0].id if world.players else 1, "category": "General Support",
+                             "claimed": False, **fields})
+    return ch
+
+async def load_and_process(p):
+    # A fresh tracker, as after a restart
+    tracker = V.ActivityTracker(V.inactivity_cfg["categories"], 5, V.inactivity_cfg["min_notice_minutes"])
+    await tracker.load(p)
+    tracker.process_due()
+    await asyncio.sleep(0.2)  # let the warning/archive jobs run
+    return tracker
+
+def test_old_tickets_are_warned_not_archived():
+    async def scenario():
+        p = V.partitions[world.guild.id]
+        now = time.time()
+        # Recorded before activity tracking, and idle through a long downtime
+        legacy = add_ticket(p, "legacy", created_at=now - 30 * 24 * HOUR)
+        stale = add_ticket(p, "stale", created_at=now - 30 * 24 * HOUR, last_activity=now - 10 * 24 * HOUR)
+
+        tracker = await load_and_process(p)
+
+        # Neither is archived, the stale one got its warning and the legacy one counts as active now
+        for ch in (legacy, stale):
+            assert not ch.name.startswith("archived-")
+            assert not (await p.store.get(str(ch.id))).get("archived")
+        assert [m.content for m in legacy.messages] == []
+        assert len(stale.messages) == 1 and "will be archived" in stale.messages[0].content
+        assert tracker.last[legacy.id] >= now
+        assert (await p.store.get(str(stale.id)))["inactivity_warned_at"] >= now
+
+        # A restart neither warns again nor archives before the notice period is over
+        await load_and_process(p)
+        assert len(stale.messages) == 1
+        assert not stale.name.startswith("archived-")
+
+    run(scenario())
+
+def test_archived_once_notice_after_warning_passed():
+    async def scenario():
+        p = V.partitions[world.guild.id]
+        now = time.time()
+        # Warned 23 hours ago: the 24 hour notice counts from the warning, not from the last activity
+        pending = add_ticket(p, "pending", created_at=now - 10 * 24 * HOUR, last_activity=now - 10 * 24 * HOUR,
+                             inactivity_warned_at=now - 23 * HOUR)
+        due = add_ticket(p, "due", created_at=now - 10 * 24 * HOUR, last_activity=now - 10 * 24 * HOUR,
+                         inactivity_warned_at=now - 25 * HOUR)
+
+        await load_and_process(p)
+
+        assert not pending.name.startswith("archived-")
+        assert pending.messages == []
+        assert due.name == "archived-due"
+        assert (await p.store.get(str(due.id)))["archived"]
+
+    run(scenario())
@@ -0,0 +1,51 @@
+"""Rank changes against the fake guild from bench.py.
+
+    python -m pytest -q tests
+"""
+from support import V, world, run
+
+def plan(roles, step):
+    member = world.guild.add_member("target", [world.roles[key] for key in roles])
+    return V.plan_rank_change(world.guild, member, step)
+
+def test_member_to_mod_gains_staff_and_keeps_member():
+    add, remove, new_role = plan(["member"], +1)
+    assert new_role is world.roles["mod"]
+    assert add == {world.roles["mod"], world.roles["staff"]}
+    assert remove == set()
+
+def test_mod_to_member_loses_staff():
+    add, remove, new_role = plan(["member", "mod", "staff"], -1)
+    assert new_role is world.roles["member"]
+    assert add == {world.roles["member"]}
+    assert remove == {world.roles["mod"], world.roles["staff"]}
+
+def test_staff_ranks_move_one_step_and_keep_staff():
+    add, remove, new_role = plan(["mod", "staff"], +1)
+    assert new_role is world.roles["sr_mod"]
+    assert add == {world.roles["sr_mod"]}
+    assert remove == {world.roles["mod"]}
+
+def test_no_change_past_either_end():
+    assert plan(["owner", "staff"], +1) is None
+    assert plan(["member"], -1) is None
+    assert plan([], -1) is None
+    # Unranked members enter at the bottom
+    add, remove, new_role = plan([], +1)
+    assert new_role is world.roles["member"] and add == {world.roles["member"]} and remove == set()
+
+def test_change_rank_plans_from_the_given_member():
+    member = world.guild.add_member("target", [world.roles["member"]])
+    calls = world.guild.api.calls
+
+    before = calls.copy()
+    assert run(V.change_rank(world.guild, member, +1, world.manager)) is world.roles["mod"]
+    made = calls - before
+    assert not any(route.startswith("GET") for route in made)
+    assert set(member.roles) - {world.guild.default_role} == {world.roles["member"], world.roles["mod"], world.roles["staff"]}
+
+    # After waiting behind another change it re-reads the member first
+    before = calls.copy()
+    assert run(V.change_rank(world.guild, member, -1, world.manager, stale=True)) is world.roles["member"]
+    assert (calls - before)["GET /guilds/{id}/members/{id}"] == 1
+    assert set(member.roles) - {world.guild.default_role} == {world.roles["member"]}
@@ -0,0 +1,90 @@
+"""The JSON ticket store: journal replay, torn writes and the snapshot/journal handover.
+
+    python -m pytest -q tests
+"""
+import json
+
+from support import V
+
+def open_store(tmp_path, compact_every=500):
+    return V.TicketStore(str(tmp_path / "data.json"), str(tmp_path / "data.journal"), compact_every)
+
+def crash(store):
+    # Stops the writer once the queued writes are on disk, without the snapshot close() leaves behind
+    store._writer.submit(store._close_journal).result()
+    store._writer.shutdown(wait=True)
+
+def on_disk(tmp_path):
+    with open(tmp_path / "data.json") as f:
+        snapshot = json.load(f)
+    with open(tmp_path / "data.journal") as f:
+        journal = [json.loads(line) for line in f]
+    return snapshot, journal
+
+def ticket(user, **fields):
+    return {"user": user, "category": "General Support", "claimed": False, **fields}
+
+def test_journal_replays_after_crash(tmp_path):
+    store = open_store(tmp_path)
+    store.put("1", ticket(10))
+    store.put("2", ticket(20))
+    store.put("3", ticket(30))
+    store.update("1", claimed=True, close_at=123.0)
+    store.update("1", close_at=None)
+    store.delete("2")
+    expected = json.loads(json.dumps(store.tickets))
+    crash(store)
+
+    # Below the compaction threshold everything is still in the journal
+    snapshot, journal = on_disk(tmp_path)
+    assert snapshot == {}
+    assert [event["op"] for event in journal] == ["put"] * 5 + ["delete"]
+
+    reopened = open_store(tmp_path)
+    assert reopened.tickets == expected == {"1": ticket(10, claimed=True), "3": ticket(30)}
+    reopened.close()
+
+def test_torn_journal_line_is_dropped_and_folded(tmp_path):
+    store = open_store(tmp_path)
+    store.put("1", ticket(10))
+    store.update("1", claimed=True)
+    crash(store)
+    # A crash halfway through appending the next event
+    with open(tmp_path / "data.journal", "a") as f:
+        f.write('{"op": "put", "id": "2", "ticket": {"us')
+
+    reopened = open_store(tmp_path)
+    assert reopened.tickets == {"1": ticket(10, claimed=True)}
+    # Startup folded the readable part into the snapshot, new events never follow the torn line
+    snapshot, journal = on_disk(tmp_path)
+    assert snapshot == reopened.tickets and journal == []
+
+    reopened.put("2", ticket(20))
+    crash(reopened)
+    assert open_store(tmp_path).tickets == {"1": ticket(10, claimed=True), "2": ticket(20)}
+
+def test_snapshot_and_journal_hand_over(tmp_path):
+    store = open_store(tmp_path, compact_every=4)
+    for n in range(1, 6):
+        store.put(str(n), ticket(n))
+    # Changed after it was handed to the store: neither the journal nor the snapshot may see it
+    store.tickets["1"]["category"] = "mid-mutation"
+    store.update("2", claimed=True)
+    expected = json.loads(json.dumps(store.tickets))
+    expected["1"]["category"] = "General Support"
+    crash(store)
+
+    # The snapshot holds what was written up to the last compaction, the journal the rest
+    snapshot, journal = on_disk(tmp_path)
+    assert snapshot == {str(n): ticket(n) for n in range(1, 5)}
+    assert [(event["op"], event["id"]) for event in journal] == [("put", "5"), ("put", "2")]
+    assert V.load_json_tickets(str(tmp_path / "data.json"), str(tmp_path / "data.journal")) == expected
+
+    # A clean shutdown leaves everything in the snapshot and an empty journal
+    reopened = open_store(tmp_path, compact_every=4)
+    assert reopened.tickets == expected
+    reopened.delete("3")
+    reopened.close()
+    snapshot, journal = on_disk(tmp_path)
+    del expected["3"]
+    assert snapshot == expected and journal == []